@@ -1,3 +1,7 @@
+import os
+import threading
+import time
+
 import torch
 from torch import nn
 from transformers import AutoConfig
@@ -14,12 +18,15 @@ from .image.configuration_image import LanguageBindImageConfig
 from .image.modeling_image import LanguageBindImage
 from .image.processing_image import LanguageBindImageProcessor
 from .image.tokenization_image import LanguageBindImageTokenizer
+from .loading import load_pretrained_parts, merge_lora_adapters
 from .thermal.configuration_thermal import LanguageBindThermalConfig
 from .thermal.modeling_thermal import LanguageBindThermal
 from .thermal.processing_thermal import LanguageBindThermalProcessor
 from .thermal.tokenization_thermal import LanguageBindThermalTokenizer
+from .token_merging import apply_token_merging
+from .tracing import TracedEncoder
 from .video.configuration_video import LanguageBindVideoConfig
-from .video.modeling_video import LanguageBindVideo
+from .video.modeling_video import LanguageBindVideo, use_strided_temporal_attention
 from .video.processing_video import LanguageBindVideoProcessor
 from .video.tokenization_video import LanguageBindVideoTokenizer
 
@@ -47,35 +54,147 @@ transform_dict = {
 
 
 class LanguageBind(nn.Module):
-    def __init__(self, clip_type, use_temp=True):
+    """
+    Set `lazy=True` to load modality towers on first use instead of at start. `preload` lists
+    modalities (including "language") to load at start anyway. With `memory_budget_mb` the least
+    recently used towers are unloaded when loaded parameters exceed the budget; the language tower
+    is never unloaded. `tower_transform(key, module)` is applied to each loaded encoder and
+    projection, e.g. to quantize them. `merge_lora=True` merges LoRA adapters of vision encoders
+    into their weights, for inference only. `token_merging_ratio` merges this share of vision tokens
+    after each encoder layer (ToMe), trading accuracy for speed. With `trace_cache_dir` encoders run
+    as TorchScript graphs traced per input shape and cached in this directory.
+    `strided_temporal_attention=False` runs video temporal attention on rearrange copies as
+    originally, to compare memory use.
+    """
+
+    _TOWER_PREFIXES = {
+        "vision": ("vision_model", "visual_projection", "logit_scale"),
+        "language": ("text_model", "text_projection"),
+    }
+
+    def __init__(
+        self,
+        clip_type,
+        use_temp=True,
+        lazy=False,
+        preload=None,
+        memory_budget_mb=None,
+        tower_transform=None,
+        trace_cache_dir=None,
+        merge_lora=False,
+        token_merging_ratio=None,
+        strided_temporal_attention=True,
+    ):
         super(LanguageBind, self).__init__()
         self.use_temp = use_temp
-        self.modality_encoder = {}
-        self.modality_proj = {}
+        self.clip_type = dict(clip_type)
+        self.memory_budget_mb = memory_budget_mb
+        self.tower_transform = tower_transform
+        self.trace_cache_dir = trace_cache_dir
+        self.merge_lora = merge_lora
+        self.token_merging_ratio = token_merging_ratio
+        self.strided_temporal_attention = strided_temporal_attention
+        self.modality_encoder = nn.ModuleDict()
+        self.modality_proj = nn.ModuleDict()
         self.modality_scale = {}
         self.modality_config = {}
+        # the language tower is taken from the last checkpoint
+        self.language_clip_type = list(clip_type.keys())[-1]
+        self._last_used = {}
+        self._lock = threading.RLock()
+        # follows .to() calls, so lazily loaded towers are placed on the same device and dtype
+        self.register_buffer("_device_marker", torch.empty(0), persistent=False)
+
         for k, v in clip_type.items():
-            pretrained_ckpt = f"LanguageBind/{v}"
-            model = model_dict[k].from_pretrained(pretrained_ckpt)
-            self.modality_encoder[k] = model.vision_model
-            self.modality_proj[k] = model.visual_projection
-            self.modality_scale[k] = model.logit_scale
-            self.modality_config[k] = model.config
-        self.modality_encoder["language"] = model.text_model
-        self.modality_proj["language"] = model.text_projection
+            self.modality_config[k] = config_dict[k].from_pretrained(f"LanguageBind/{v}")
+        if not lazy:
+            preload = list(clip_type.keys()) + ["language"]
+        for k in preload or []:
+            self.load_modality(k)
+
+    def load_modality(self, key):
+        with self._lock:
+            if key not in self.modality_encoder:
+                clip_type_key = self.language_clip_type if key == "language" else key
+                # read only the tower's weights instead of the whole checkpoint
+                model = load_pretrained_parts(
+                    model_dict[clip_type_key],
+                    f"LanguageBind/{self.clip_type[clip_type_key]}",
+                    prefixes=self._TOWER_PREFIXES["language" if key == "language" else "vision"],
+                    config=self.modality_config[clip_type_key],
+                )
+                if self.merge_lora and key != "language":
+                    merge_lora_adapters(model)
+                if self.token_merging_ratio and key != "language":
+                    apply_token_merging(model.vision_model, ratio=self.token_merging_ratio)
+                if not self.strided_temporal_attention:
+                    use_strided_temporal_attention(model, enabled=False)
+                self._register_tower(key, model)
+                for modules in (self.modality_encoder, self.modality_proj):
+                    modules[key].to(
+                        device=self._device_marker.device, dtype=self._device_marker.dtype
+                    )
+                    modules[key].train(self.training)
+                    if self.tower_transform is not None:
+                        modules[key] = self.tower_transform(key, modules[key])
+                if self.trace_cache_dir is not None:
+                    self.modality_encoder[key] = TracedEncoder(
+                        self.modality_encoder[key],
+                        cache_dir=os.path.join(
+                            self.trace_cache_dir, self.clip_type[clip_type_key], key
+                        ),
+                        cache_key=f"{self.clip_type[clip_type_key]}/{key}",
+                    )
+            self._last_used[key] = time.monotonic()
+            if self.memory_budget_mb is not None:
+                self._unload_over_budget(keep=key)
+            return self.modality_encoder[key], self.modality_proj[key], self.modality_scale.get(key)
+
+    def unload_modality(self, key):
+        with self._lock:
+            if key in self.modality_encoder:
+                del self.modality_encoder[key]
+                del self.modality_proj[key]
+            self.modality_scale.pop(key, None)
+            self._last_used.pop(key, None)
+
+    def _register_tower(self, key, model):
+        if key == "language":
+            self.modality_encoder[key] = model.text_model
+            self.modality_proj[key] = model.text_projection
+        else:
+            self.modality_encoder[key] = model.vision_model
+            self.modality_proj[key] = model.visual_projection
+            self.modality_scale[key] = model.logit_scale
 
-        self.modality_encoder = nn.ModuleDict(self.modality_encoder)
-        self.modality_proj = nn.ModuleDict(self.modality_proj)
+    def _unload_over_budget(self, keep):
+        sizes = {
+            k: sum(
+                p.numel() * p.element_size()
+                for m in (self.modality_encoder[k], self.modality_proj[k])
+                for p in m.parameters()
+            )
+            for k in self.modality_encoder
+        }
+        budget = self.memory_budget_mb * 2**20
+        for k in sorted(sizes, key=lambda x: self._last_used.get(x, 0.0)):
+            if sum(sizes.values()) <= budget:
+                break
+            if k in (keep, "language"):
+                continue
+            self.unload_modality(k)
+            sizes.pop(k)
 
     def forward(self, inputs):
         outputs = {}
         for key, value in inputs.items():
-            value = self.modality_encoder[key](**value)[1]
-            value = self.modality_proj[key](value)
+            encoder, proj, scale = self.load_modality(key)
+            value = encoder(**value)[1]
+            value = proj(value)
             value = value / value.norm(p=2, dim=-1, keepdim=True)
             if self.use_temp:
                 if key != "language":
-                    value = value * self.modality_scale[key].exp()
+                    value = value * scale.exp()
             outputs[key] = value
         return outputs
 
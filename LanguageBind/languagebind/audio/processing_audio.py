@@ -1,3 +1,5 @@
+import threading
+
 import numpy as np
 import torch
 import torchaudio
@@ -27,33 +29,56 @@ def float32_to_int16_torch(x):
 
 
 DEFAULT_AUDIO_FRAME_SHIFT_MS = 10
+DEFAULT_AUDIO_FRAME_LENGTH_MS = 25
 
 
 class AudioTransform:
-    def __init__(self, args):
+    """
+    With `deterministic=True` chunks of long audio are taken at fixed positions instead of random
+    ones, so embeddings are reproducible and can be cached. Resampling kernels are built once per
+    source sample rate.
+    """
+
+    def __init__(self, args, deterministic=False):
         self.sample_rate = args.audio_sample_rate
         self.num_mel_bins = args.num_mel_bins
         self.target_length = args.target_length
         self.audio_mean = args.audio_mean
         self.audio_std = args.audio_std
+        self.deterministic = deterministic
         self.mean = []
         self.std = []
+        self._resamplers = {}
+        self._lock = threading.Lock()
         # mean=-4.2677393
         # std=4.5689974
         # self.norm = transforms.Normalize(mean=self.audio_mean, std=self.audio_std)
 
     def __call__(self, audio_data_and_origin_sr):
-        audio_data, origin_sr = audio_data_and_origin_sr
-        if self.sample_rate != origin_sr:
-            # print(audio_data.shape, origin_sr)
-            audio_data = torchaudio.functional.resample(
-                audio_data, orig_freq=origin_sr, new_freq=self.sample_rate
-            )
-        waveform_melspec = self.waveform2melspec(audio_data)
-        return waveform_melspec
+        return self.batch([audio_data_and_origin_sr])[0]
+
+    def batch(self, audio_data_and_origin_srs):
+        """Transforms a list of `(waveform, sample_rate)` with one fbank call for all of them."""
+        audio_data = [self.resample(data, sr) for data, sr in audio_data_and_origin_srs]
+        mels = self.get_mels(audio_data)
+        return torch.stack([self.mel2melspec(mel) for mel in mels])
+
+    def resample(self, audio_data, origin_sr):
+        if self.sample_rate == origin_sr:
+            return audio_data
+        with self._lock:
+            if origin_sr not in self._resamplers:
+                # same defaults as torchaudio.functional.resample, the kernel is computed once
+                self._resamplers[origin_sr] = torchaudio.transforms.Resample(
+                    orig_freq=origin_sr, new_freq=self.sample_rate
+                )
+            resampler = self._resamplers[origin_sr]
+        return resampler(audio_data)
 
     def waveform2melspec(self, audio_data):
-        mel = self.get_mel(audio_data)
+        return self.mel2melspec(self.get_mel(audio_data))
+
+    def mel2melspec(self, mel):
         if mel.shape[0] > self.target_length:
             # split to three parts
             chunk_frames = self.target_length
@@ -67,10 +92,14 @@ class AudioTransform:
                 ranges[1] = [0]
             if len(ranges[2]) == 0:  # if the audio is too short, we just use the first chunk
                 ranges[2] = [0]
-            # randomly choose index for each part
-            idx_front = np.random.choice(ranges[0])
-            idx_middle = np.random.choice(ranges[1])
-            idx_back = np.random.choice(ranges[2])
+            if self.deterministic:
+                # the middle of each part, the expected position of a random choice
+                idx_front, idx_middle, idx_back = (r[len(r) // 2] for r in ranges)
+            else:
+                # randomly choose index for each part
+                idx_front = np.random.choice(ranges[0])
+                idx_middle = np.random.choice(ranges[1])
+                idx_back = np.random.choice(ranges[2])
             # idx_front = ranges[0][0]  # fixed
             # idx_middle = ranges[1][0]
             # idx_back = ranges[2][0]
@@ -98,25 +127,48 @@ class AudioTransform:
         return mel_fusion
 
     def get_mel(self, audio_data):
+        return self.get_mels([audio_data])[0]
+
+    def get_mels(self, audio_data_list):
+        """
+        fbank of several waveforms in one call. fbank frames are computed independently, so the
+        waveforms are concatenated, each padded to a multiple of the frame shift, and frames of each
+        one are sliced out; no sliced frame overlaps padding or another waveform.
+        """
+        frame_shift = int(self.sample_rate * DEFAULT_AUDIO_FRAME_SHIFT_MS / 1000)
+        frame_length = int(self.sample_rate * DEFAULT_AUDIO_FRAME_LENGTH_MS / 1000)
+        waveforms, frames = [], []
+        for audio_data in audio_data_list:
+            # fbank uses the first channel
+            waveform = audio_data[0] - audio_data.mean()
+            num_frames = max(0, 1 + (waveform.shape[0] - frame_length) // frame_shift)
+            padding = -waveform.shape[0] % frame_shift
+            waveforms.append(torch.nn.functional.pad(waveform, (0, padding)))
+            frames.append(num_frames)
+
         # mel shape: (n_mels, T)
-        audio_data -= audio_data.mean()
         mel = torchaudio.compliance.kaldi.fbank(
-            audio_data,
+            torch.cat(waveforms).unsqueeze(0),
             htk_compat=True,
             sample_frequency=self.sample_rate,
             use_energy=False,
             window_type="hanning",
             num_mel_bins=self.num_mel_bins,
             dither=0.0,
-            frame_length=25,
+            frame_length=DEFAULT_AUDIO_FRAME_LENGTH_MS,
             frame_shift=DEFAULT_AUDIO_FRAME_SHIFT_MS,
         )
-        return mel  # (T, n_mels)
 
+        mels, offset = [], 0
+        for waveform, num_frames in zip(waveforms, frames):
+            mels.append(mel[offset : offset + num_frames])
+            offset += waveform.shape[0] // frame_shift
+        return mels  # [(T, n_mels)]
 
-def get_audio_transform(config):
+
+def get_audio_transform(config, deterministic=False):
     config = config.vision_config
-    return AudioTransform(config)
+    return AudioTransform(config, deterministic=deterministic)
 
 
 def load_and_transform_audio(
@@ -130,13 +182,19 @@ def load_and_transform_audio(
 
 
 class LanguageBindAudioProcessor(ProcessorMixin):
+    """
+    Audio of a batch is transformed with one fbank call. Inputs are paths or already decoded
+    `(waveform, sample_rate)` tuples. `deterministic=True` takes chunks of long audio at fixed
+    positions, see `AudioTransform`.
+    """
+
     attributes = []
     tokenizer_class = "LanguageBindAudioTokenizer"
 
-    def __init__(self, config, tokenizer=None, **kwargs):
+    def __init__(self, config, tokenizer=None, deterministic=False, **kwargs):
         super().__init__(**kwargs)
         self.config = config
-        self.transform = get_audio_transform(config)
+        self.transform = get_audio_transform(config, deterministic=deterministic)
         self.image_processor = load_and_transform_audio
         self.tokenizer = tokenizer
 
@@ -156,8 +214,10 @@ class LanguageBindAudioProcessor(ProcessorMixin):
 
         if images is not None:
             images = make_list_of_images(images)
-            image_features = [self.image_processor(image, self.transform) for image in images]
-            image_features = torch.stack(image_features)
+            waveforms = [
+                image if isinstance(image, tuple) else torchaudio_loader(image) for image in images
+            ]
+            image_features = self.transform.batch(waveforms)
 
         if text is not None and images is not None:
             encoding["pixel_values"] = image_features
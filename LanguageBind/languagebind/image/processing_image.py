@@ -1,8 +1,9 @@
-import torch
 from PIL import Image
 from torchvision import transforms
 from transformers import ProcessorMixin
 
+from ..preprocessing import ParallelLoader
+
 OPENAI_DATASET_MEAN = (0.48145466, 0.4578275, 0.40821073)
 OPENAI_DATASET_STD = (0.26862954, 0.26130258, 0.27577711)
 
@@ -26,21 +27,36 @@ def get_image_transform(config):
     return transform
 
 
-def load_and_transform_image(image_path, transform):
-    image = Image.open(image_path).convert("RGB")
+def load_and_transform_image(image_path, transform, draft=False):
+    image = Image.open(image_path)
+    if draft:
+        # JPEG is decoded at the smallest scale still covering the crop, the resize then runs on it
+        image.draft("RGB", (224, 224))
+    image = image.convert("RGB")
     image_outputs = transform(image)
     return image_outputs
 
 
 class LanguageBindImageProcessor(ProcessorMixin):
+    """
+    Images are decoded and transformed by `num_workers` threads into one batch tensor. `draft=True`
+    decodes JPEG images downscaled, which is much faster for large photos but changes pixel values
+    slightly.
+    """
+
     attributes = []
     tokenizer_class = "LanguageBindImageTokenizer"
 
-    def __init__(self, config, tokenizer=None, **kwargs):
+    def __init__(self, config, tokenizer=None, num_workers=None, draft=False, **kwargs):
         super().__init__(**kwargs)
         self.config = config
         self.transform = get_image_transform(config)
         self.image_processor = load_and_transform_image
+        self.draft = draft
+        self.loader = ParallelLoader(
+            lambda image: self.image_processor(image, self.transform, draft=self.draft),
+            num_workers=num_workers,
+        )
         self.tokenizer = tokenizer
 
     def __call__(self, images=None, text=None, context_length=77, return_tensors=None, **kwargs):
@@ -59,8 +75,7 @@ class LanguageBindImageProcessor(ProcessorMixin):
 
         if images is not None:
             images = make_list_of_images(images)
-            image_features = [self.image_processor(image, self.transform) for image in images]
-            image_features = torch.stack(image_features)
+            image_features = self.loader(images, shape=(3, 224, 224))
 
         if text is not None and images is not None:
             encoding["pixel_values"] = image_features
@@ -0,0 +1,109 @@
+import json
+
+import torch
+from accelerate import init_empty_weights
+from peft import PeftModel
+from safetensors import safe_open
+from torch import nn
+from transformers.modeling_utils import no_init_weights
+from transformers.utils import (
+    SAFE_WEIGHTS_INDEX_NAME,
+    SAFE_WEIGHTS_NAME,
+    WEIGHTS_INDEX_NAME,
+    WEIGHTS_NAME,
+    cached_file,
+)
+
+
+def load_pretrained_parts(model_cls, pretrained_ckpt, prefixes, config=None):
+    """
+    Builds `model_cls` with parameters on the meta device and without initializing them, then
+    allocates and loads from the checkpoint only the submodules (or parameters) named in `prefixes`,
+    e.g. ("vision_model", "visual_projection"). Safetensors checkpoints are memory-mapped, so the
+    other tensors are never read. Other checkpoints are memory-mapped on torch>=2.1 and read whole
+    before, with the tensors not needed freed right away. Parameters of other submodules stay on the
+    meta device and must not be used.
+    """
+    config = (
+        config if config is not None else model_cls.config_class.from_pretrained(pretrained_ckpt)
+    )
+    # accelerate (a peft dependency) keeps new parameters on the meta device on any torch version
+    with init_empty_weights(), no_init_weights():
+        model = model_cls(config)
+
+    for prefix in prefixes:
+        target = getattr(model, prefix)
+        if isinstance(target, nn.Module):
+            target.to_empty(device="cpu")
+        else:
+            setattr(model, prefix, nn.Parameter(torch.empty_like(target, device="cpu")))
+
+    state_dict = _load_state_dict(pretrained_ckpt, prefixes)
+    missing_keys, _ = model.load_state_dict(state_dict, strict=False)
+    for key in missing_keys:
+        if not _matches(key, prefixes):
+            continue
+        if key.endswith("position_ids"):
+            # not saved by recent transformers versions
+            module = model.get_submodule(key.rsplit(".", 1)[0])
+            num_positions = module.position_ids.shape[-1]
+            module.register_buffer("position_ids", torch.arange(num_positions).expand((1, -1)))
+        else:
+            raise ValueError(f"Checkpoint {pretrained_ckpt} has no weights for {key}")
+    model.eval()
+    return model
+
+
+def merge_lora_adapters(model):
+    """
+    Merges the LoRA adapters added by `convert_to_lora` into the base Linear weights, so the vision
+    encoder runs as a plain CLIPEncoder. For inference only, the adapters can not be trained
+    afterwards.
+    """
+    encoder = model.vision_model.encoder
+    if isinstance(encoder, PeftModel):
+        model.vision_model.encoder = encoder.merge_and_unload()
+    return model
+
+
+def _matches(key, prefixes):
+    return any(key == p or key.startswith(f"{p}.") for p in prefixes)
+
+
+def _load_state_dict(pretrained_ckpt, prefixes):
+    def is_needed(key):
+        return _matches(key, prefixes)
+
+    for weights_name, index_name in (
+        (SAFE_WEIGHTS_NAME, SAFE_WEIGHTS_INDEX_NAME),
+        (WEIGHTS_NAME, WEIGHTS_INDEX_NAME),
+    ):
+        path = cached_file(
+            pretrained_ckpt, weights_name, _raise_exceptions_for_missing_entries=False
+        )
+        if path is not None:
+            return _read_tensors(path, is_needed)
+
+        index_path = cached_file(
+            pretrained_ckpt, index_name, _raise_exceptions_for_missing_entries=False
+        )
+        if index_path is not None:
+            with open(index_path) as f:
+                weight_map = json.load(f)["weight_map"]
+            state_dict = {}
+            for shard in sorted({v for k, v in weight_map.items() if is_needed(k)}):
+                state_dict.update(_read_tensors(cached_file(pretrained_ckpt, shard), is_needed))
+            return state_dict
+    raise OSError(f"No weights found for {pretrained_ckpt}")
+
+
+def _read_tensors(path, is_needed):
+    if path.endswith(".safetensors"):
+        with safe_open(path, framework="pt", device="cpu") as f:
+            return {k: f.get_tensor(k) for k in f.keys() if is_needed(k)}
+
+    try:
+        state_dict = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    except TypeError:  # torch<2.1 can not memory-map checkpoints
+        state_dict = torch.load(path, map_location="cpu")
+    return {k: v for k, v in state_dict.items() if is_needed(k)}
@@ -0,0 +1,106 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+
+class ParallelLoader:
+    """
+    Runs `load(item)` for a batch of items in a pool of `num_workers` threads and copies each output
+    into a preallocated batch tensor as soon as it is ready. Decoding and resizing in PIL, OpenCV
+    and torch release the GIL, so threads are enough. With `num_workers=0` items are loaded in the
+    calling thread. With `group_by`, items with the same key are loaded together by one worker:
+    `load(items)` then gets the list of them and returns an iterable of their outputs, e.g. to
+    decode several spans of a video from a single open of it. Groups larger than a fair share of the
+    batch per worker are split, so one long video still keeps all workers busy. `get_stats` reports
+    the loading throughput, to compare with the model.
+    """
+
+    def __init__(self, load, num_workers=None, group_by=None):
+        self.load = load
+        self.num_workers = min(8, os.cpu_count() or 1) if num_workers is None else num_workers
+        self.group_by = group_by
+        self._executor = None
+        self._lock = threading.Lock()
+        self._items = 0
+        self._wall_seconds = 0.0
+        self._busy_seconds = 0.0
+        self._capacity_seconds = 0.0
+
+    def __call__(self, items, shape, dtype=torch.float32):
+        started = time.perf_counter()
+        batch = torch.empty((len(items), *shape), dtype=dtype)
+        tasks = self._get_tasks(items)
+        workers = min(self.num_workers, len(tasks))
+        if workers <= 1:
+            workers = 1
+            for indexes, task_items in tasks:
+                self._load_into(batch, indexes, task_items)
+        else:
+            self._load_parallel(batch, tasks)
+        wall_seconds = time.perf_counter() - started
+        with self._lock:
+            self._items += len(items)
+            self._wall_seconds += wall_seconds
+            self._capacity_seconds += wall_seconds * workers
+        return batch
+
+    def get_stats(self):
+        """
+        Items loaded per second of wall time and the share of time the used workers were busy.
+        Utilization well below 1 means items of a batch take uneven time to load.
+        """
+        with self._lock:
+            return {
+                "items_total": self._items,
+                "items_per_second": self._items / self._wall_seconds if self._wall_seconds else 0.0,
+                "worker_utilization": (
+                    self._busy_seconds / self._capacity_seconds if self._capacity_seconds else 0.0
+                ),
+            }
+
+    def _get_tasks(self, items):
+        if self.group_by is None:
+            return [([i], [item]) for i, item in enumerate(items)]
+        groups = {}
+        for i, item in enumerate(items):
+            indexes, group_items = groups.setdefault(self.group_by(item), ([], []))
+            indexes.append(i)
+            group_items.append(item)
+        size = max(1, math.ceil(len(items) / max(self.num_workers, 1)))
+        return [
+            (indexes[j : j + size], group_items[j : j + size])
+            for indexes, group_items in groups.values()
+            for j in range(0, len(indexes), size)
+        ]
+
+    def _load_parallel(self, batch, tasks):
+        futures = [
+            self._get_executor().submit(self._load_into, batch, indexes, task_items)
+            for indexes, task_items in tasks
+        ]
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _load_into(self, batch, indexes, items):
+        started = time.perf_counter()
+        outputs = self.load(items) if self.group_by else [self.load(items[0])]
+        for i, output in zip(indexes, outputs):
+            batch[i].copy_(output)
+        with self._lock:
+            self._busy_seconds += time.perf_counter() - started
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.num_workers, thread_name_prefix="languagebind-preprocess"
+                )
+            return self._executor
@@ -0,0 +1,73 @@
+import threading
+
+import torch
+
+
+def apply_token_merging(vision_model, ratio):
+    """
+    Token merging (ToMe, Bolya et al. 2023) for inference: after each encoder layer the `ratio` of
+    tokens most similar to another token are merged into it by bipartite soft matching, so later
+    layers process fewer tokens. The class token is never merged. For video the merge is computed on
+    tokens averaged over frames and shared by all frames of a clip, so temporal attention still sees
+    the same tokens per frame.
+    """
+    if not 0 < ratio < 0.5:
+        raise ValueError(f"Token merging ratio should be in (0, 0.5), got {ratio}")
+
+    layers = [m for m in vision_model.modules() if type(m).__name__ == "CLIPEncoderLayer"]
+    state = threading.local()
+
+    def reset_sizes(module, args):
+        state.size = None
+
+    def merge_tokens(module, args, outputs):
+        hidden_states = outputs[0]
+        num_frames = module.t if getattr(module, "add_time_attn", False) else 1
+        hidden_states, state.size = _merge(
+            hidden_states, state.size, ratio=ratio, num_frames=num_frames
+        )
+        return (hidden_states,) + tuple(outputs[1:])
+
+    handles = [layers[0].register_forward_pre_hook(reset_sizes)]
+    handles += [layer.register_forward_hook(merge_tokens) for layer in layers]
+    return handles
+
+
+def _merge(x, size, ratio, num_frames):
+    bt, n, c = x.shape
+    # the first token of the "a" set is the class token, it is kept
+    r = min(int(n * ratio), (n + 1) // 2 - 1)
+    if r <= 0:
+        return x, size
+    if size is None:
+        size = torch.ones(bt, n, 1, dtype=x.dtype, device=x.device)
+
+    with torch.no_grad():
+        metric = x.view(bt // num_frames, num_frames, n, c).mean(dim=1)
+        metric = metric / metric.norm(dim=-1, keepdim=True)
+        a, b = metric[:, ::2], metric[:, 1::2]
+        scores = a @ b.transpose(-1, -2)
+        scores[:, 0, :] = -float("inf")
+
+        node_max, node_idx = scores.max(dim=-1)
+        edge_idx = node_max.argsort(dim=-1, descending=True)[..., None]
+        # sorted to keep the class token first and the order of other tokens
+        unm_idx = edge_idx[:, r:].sort(dim=1)[0]
+        src_idx = edge_idx[:, :r]
+        dst_idx = node_idx[..., None].gather(dim=1, index=src_idx)
+        unm_idx, src_idx, dst_idx = (
+            idx.repeat_interleave(num_frames, dim=0) for idx in (unm_idx, src_idx, dst_idx)
+        )
+
+    def merge(t):
+        src, dst = t[:, ::2], t[:, 1::2]
+        d = t.shape[-1]
+        unm = src.gather(dim=1, index=unm_idx.expand(-1, -1, d))
+        src = src.gather(dim=1, index=src_idx.expand(-1, -1, d))
+        dst = dst.scatter_add(1, dst_idx.expand(-1, -1, d), src)
+        return torch.cat([unm, dst], dim=1)
+
+    # size weighted average of merged tokens
+    x = merge(x * size)
+    size = merge(size)
+    return x / size, size
@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import os
+import threading
+
+import torch
+import transformers
+from torch import nn
+
+logger = logging.getLogger(__name__)
+
+
+class TracedEncoder(nn.Module):
+    """
+    Runs `encoder` as TorchScript graphs traced at fixed input shapes. A graph is traced on the
+    first call with a new input signature (names, shapes, dtypes and device) and saved to
+    `cache_dir`, keyed by `cache_key`, the signature and torch/transformers versions, so later
+    starts reuse it. Each graph is checked against eager outputs once with `atol`; mismatching
+    graphs, signatures beyond `max_signatures` and calls asking for attentions or hidden states run
+    eagerly.
+    """
+
+    def __init__(self, encoder, cache_dir, cache_key, max_signatures=8, atol=1e-4):
+        super().__init__()
+        self.encoder = encoder
+        self.cache_dir = cache_dir
+        self.cache_key = cache_key
+        self.max_signatures = max_signatures
+        self.atol = atol
+        self._graphs = {}
+        self._lock = threading.Lock()
+        # a new module is in training mode, which always runs eagerly
+        self.train(encoder.training)
+
+    @property
+    def config(self):
+        return self.encoder.config
+
+    def forward(
+        self, output_attentions=None, output_hidden_states=None, return_dict=None, **inputs
+    ):
+        if output_attentions or output_hidden_states or self.training:
+            return self.encoder(
+                output_attentions=output_attentions,
+                output_hidden_states=output_hidden_states,
+                return_dict=return_dict,
+                **inputs,
+            )
+
+        names = tuple(sorted(inputs))
+        signature = tuple(
+            (k, tuple(inputs[k].shape), str(inputs[k].dtype), str(inputs[k].device)) for k in names
+        )
+        graph = self._get_graph(signature, names, inputs)
+        if graph is None:
+            return self.encoder(return_dict=return_dict, **inputs)
+        return graph(*(inputs[k] for k in names))
+
+    def _get_graph(self, signature, names, inputs):
+        with self._lock:
+            if signature in self._graphs:
+                return self._graphs[signature]
+            if len(self._graphs) >= self.max_signatures:
+                return None
+
+            call = _EncoderCall(self.encoder, names)
+            args = tuple(inputs[k] for k in names)
+            path = os.path.join(self.cache_dir, f"{self._digest(signature)}.pt")
+            graph = None
+            if os.path.exists(path):
+                try:
+                    graph = torch.jit.load(path, map_location=args[0].device)
+                except Exception as e:
+                    logger.warning("Failed to load traced encoder %s: %s", path, e)
+            with torch.no_grad():
+                if graph is None:
+                    graph = torch.jit.trace(call, args, check_trace=False)
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    torch.jit.save(graph, path)
+                    logger.info("Traced %s encoder for %s to %s", self.cache_key, signature, path)
+
+                expected, actual = call(*args), graph(*args)
+            if not all(torch.allclose(e, a, atol=self.atol) for e, a in zip(expected, actual)):
+                logger.warning(
+                    "Traced %s encoder differs from eager for %s, using eager",
+                    self.cache_key,
+                    signature,
+                )
+                graph = None
+            elif not _share_parameters(call, graph):
+                # the loaded graph keeps its own copy of weights otherwise
+                graph = torch.jit.trace(call, args, check_trace=False)
+            self._graphs[signature] = graph
+            return graph
+
+    def _digest(self, signature):
+        key = (
+            self.cache_key,
+            signature,
+            torch.__version__,
+            transformers.__version__,
+            repr(self.encoder),
+        )
+        return hashlib.sha256(repr(key).encode()).hexdigest()[:32]
+
+
+class _EncoderCall(nn.Module):
+    def __init__(self, encoder, names):
+        super().__init__()
+        self.encoder = encoder
+        self.names = names
+
+    def forward(self, *args):
+        outputs = self.encoder(**dict(zip(self.names, args)), return_dict=False)
+        return outputs[0], outputs[1]
+
+
+def _share_parameters(module, graph):
+    parameters = dict(module.named_parameters())
+    graph_parameters = dict(graph.named_parameters())
+    if parameters.keys() != graph_parameters.keys():
+        return False
+    for name, parameter in parameters.items():
+        if parameter.shape != graph_parameters[name].shape:
+            return False
+    for name, parameter in parameters.items():
+        graph_parameters[name].data = parameter.data
+    return True
@@ -182,6 +182,9 @@ class PatchDropout(nn.Module):
 
 
 class CLIPEncoderLayer(nn.Module):
+    # see `use_strided_temporal_attention`
+    strided_temporal_attn = True
+
     def __init__(self, config: LanguageBindVideoConfig):
         super().__init__()
         self.embed_dim = config.hidden_size
@@ -222,7 +225,34 @@ class CLIPEncoderLayer(nn.Module):
                 returned tensors for more detail.
         """
 
-        if self.add_time_attn:
+        if self.add_time_attn and self.strided_temporal_attn:
+            bt, n, d = hidden_states.shape
+            t = self.t
+            b = bt // t
+
+            # time embed
+            # (b t) n d is viewed as b t n d and transposed to b n t d with strides, which avoids
+            # the rearrange copies; element-wise ops on the views allocate only their outputs
+            if t != 1:
+                temporal_embedding = self.temporal_embedding[:, :t, :].unsqueeze(2)  # 1 t 1 d
+                hidden_states = hidden_states.reshape(b, t, n, d) + temporal_embedding
+                hidden_states = hidden_states.view(bt, n, d)
+
+            # time attn
+            residual = hidden_states
+            # hidden_states = self.layer_norm1(hidden_states)  # share layernorm
+            hidden_states = hidden_states.reshape(b, t, n, d).transpose(1, 2)
+            hidden_states = self.temporal_layer_norm1(hidden_states)  # contiguous b n t d
+            hidden_states, attn_weights = self.temporal_attn(
+                hidden_states=hidden_states.reshape(b * n, t, d),
+                attention_mask=attention_mask,
+                causal_attention_mask=causal_attention_mask,
+                output_attentions=output_attentions,
+            )
+            hidden_states = hidden_states.view(b, n, t, d).transpose(1, 2)
+            hidden_states = (residual.reshape(b, t, n, d) + hidden_states).reshape(bt, n, d)
+
+        elif self.add_time_attn:
             bt, n, d = hidden_states.shape
             t = self.t
 
@@ -278,6 +308,18 @@ class CLIPEncoderLayer(nn.Module):
         return outputs
 
 
+def use_strided_temporal_attention(module, enabled=True):
+    """
+    Switches temporal attention of video encoder layers in `module` between strided views (the
+    default) and the original rearrange copies, e.g. to compare their memory use. Outputs are the
+    same.
+    """
+    for submodule in module.modules():
+        if isinstance(submodule, CLIPEncoderLayer):
+            submodule.strided_temporal_attn = enabled
+    return module
+
+
 class CLIPPreTrainedModel(PreTrainedModel):
     """
     An abstract class to handle weights initialization and a simple interface for downloading and loading pretrained
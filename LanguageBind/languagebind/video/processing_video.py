@@ -1,3 +1,7 @@
+import math
+import subprocess
+from functools import lru_cache
+
 import cv2
 import decord
 import numpy as np
@@ -13,10 +17,16 @@ from torchvision.transforms._transforms_video import (
 )
 from transformers import ProcessorMixin
 
+from ..preprocessing import ParallelLoader
+
 decord.bridge.set_bridge("torch")
 
 OPENAI_DATASET_MEAN = (0.48145466, 0.4578275, 0.40821073)
 OPENAI_DATASET_STD = (0.26862954, 0.26130258, 0.27577711)
+# a seek decodes from the previous keyframe, so frames up to a keyframe interval ahead are grabbed;
+# the interval is probed from the first seconds of a video, 2 seconds are assumed without ffprobe
+OPENCV_MAX_GRAB_SEC = 2.0
+OPENCV_KEYFRAME_PROBE_SEC = 30
 
 
 def make_list_of_images(x):
@@ -58,6 +68,16 @@ def get_video_transform(config):
     return transform
 
 
+def get_frame_ids(frame_count, fps, num_frames, clip_start_sec=0.0, clip_end_sec=None):
+    """Indexes of `num_frames` frames sampled evenly over the span, the whole video by default."""
+    first, last = 0, frame_count - 1
+    if fps > 0:
+        first = min(int(clip_start_sec * fps), last)
+        if clip_end_sec is not None:
+            last = max(first, min(math.ceil(clip_end_sec * fps) - 1, last))
+    return np.linspace(first, last, num_frames, dtype=int)
+
+
 def load_and_transform_video(
     video_path,
     transform,
@@ -65,55 +85,202 @@ def load_and_transform_video(
     clip_start_sec=0.0,
     clip_end_sec=None,
     num_frames=8,
+    decord_num_threads=0,
+    opencv_strategy="auto",
+):
+    (video_outputs,) = load_and_transform_video_spans(
+        video_path,
+        [(clip_start_sec, clip_end_sec)],
+        transform,
+        video_decode_backend=video_decode_backend,
+        num_frames=num_frames,
+        decord_num_threads=decord_num_threads,
+        opencv_strategy=opencv_strategy,
+    )
+    return video_outputs
+
+
+def load_and_transform_video_spans(
+    video_path,
+    spans,
+    transform,
+    video_decode_backend="opencv",
+    num_frames=8,
+    decord_num_threads=0,
+    opencv_strategy="auto",
 ):
+    """
+    Yields transformed frames for each `(start_sec, end_sec)` span of a video, which is opened once.
+    decord and opencv decode only the sampled frames, seeking to them from the nearest keyframes.
+    See `read_opencv_frames` for `opencv_strategy`.
+    """
     if video_decode_backend == "pytorchvideo":
         #  decord pyav
         video = EncodedVideo.from_path(video_path, decoder="decord", decode_audio=False)
         duration = video.duration
-        start_sec = clip_start_sec  # secs
-        end_sec = clip_end_sec if clip_end_sec is not None else duration  # secs
-        video_data = video.get_clip(start_sec=start_sec, end_sec=end_sec)
-        video_outputs = transform(video_data)
+        for start_sec, end_sec in spans:
+            end_sec = end_sec if end_sec is not None else duration  # secs
+            video_data = video.get_clip(start_sec=start_sec, end_sec=end_sec)
+            yield transform(video_data)
 
     elif video_decode_backend == "decord":
         decord.bridge.set_bridge("torch")
-        decord_vr = VideoReader(video_path, ctx=cpu(0))
+        decord_vr = VideoReader(video_path, ctx=cpu(0), num_threads=decord_num_threads)
         duration = len(decord_vr)
-        frame_id_list = np.linspace(0, duration - 1, num_frames, dtype=int)
-        video_data = decord_vr.get_batch(frame_id_list)
-        video_data = video_data.permute(3, 0, 1, 2)  # (T, H, W, C) -> (C, T, H, W)
-        video_outputs = transform(video_data)
+        fps = decord_vr.get_avg_fps()
+        for start_sec, end_sec in spans:
+            frame_id_list = get_frame_ids(duration, fps, num_frames, start_sec, end_sec)
+            video_data = decord_vr.get_batch(frame_id_list)
+            video_data = video_data.permute(3, 0, 1, 2)  # (T, H, W, C) -> (C, T, H, W)
+            yield transform(video_data)
 
     elif video_decode_backend == "opencv":
         cv2_vr = cv2.VideoCapture(video_path)
-        duration = int(cv2_vr.get(cv2.CAP_PROP_FRAME_COUNT))
-        frame_id_list = np.linspace(0, duration - 1, num_frames, dtype=int)
-
-        video_data = []
-        for frame_idx in frame_id_list:
-            cv2_vr.set(1, frame_idx)
-            _, frame = cv2_vr.read()
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            video_data.append(torch.from_numpy(frame).permute(2, 0, 1))
-        cv2_vr.release()
-        video_data = torch.stack(video_data, dim=1)
-        video_outputs = transform(video_data)
+        try:
+            duration = int(cv2_vr.get(cv2.CAP_PROP_FRAME_COUNT))
+            fps = cv2_vr.get(cv2.CAP_PROP_FPS)
+            max_grab = None
+            if opencv_strategy == "auto" and fps > 0:
+                keyframe_interval = probe_keyframe_interval(video_path)
+                if keyframe_interval is not None:
+                    max_grab = max(1, round(keyframe_interval * fps))
+            for start_sec, end_sec in spans:
+                frame_id_list = get_frame_ids(duration, fps, num_frames, start_sec, end_sec)
+
+                video_data = []
+                frames = read_opencv_frames(
+                    cv2_vr, frame_id_list, strategy=opencv_strategy, max_grab=max_grab
+                )
+                for frame in frames:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    video_data.append(torch.from_numpy(frame).permute(2, 0, 1))
+                video_data = torch.stack(video_data, dim=1)
+                yield transform(video_data)
+        finally:
+            cv2_vr.release()
     else:
         raise NameError("video_decode_backend should specify in (pytorchvideo, decord, opencv)")
-    return video_outputs
+
+
+def read_opencv_frames(cv2_vr, frame_ids, strategy="auto", max_grab=None):
+    """
+    Reads frames `frame_ids` in increasing order from an opened `cv2.VideoCapture`. "seek" seeks to
+    every frame, which decodes from the previous keyframe each time. "sequential" seeks once to the
+    first frame and then grabs (decodes without converting) the frames in between. "auto" grabs
+    frames up to `max_grab` frames ahead and seeks to farther ones: with the keyframe interval as
+    `max_grab` a seek then always lands after a keyframe closer than the current position.
+    `OPENCV_MAX_GRAB_SEC` is used by default.
+    """
+    if strategy not in ("auto", "seek", "sequential"):
+        raise ValueError(f"opencv_strategy should be auto, seek or sequential, got {strategy}")
+    if max_grab is None:
+        fps = cv2_vr.get(cv2.CAP_PROP_FPS)
+        max_grab = int(OPENCV_MAX_GRAB_SEC * fps) if fps > 0 else 60
+
+    frames = []
+    position = int(cv2_vr.get(cv2.CAP_PROP_POS_FRAMES))
+    for i, frame_idx in enumerate(frame_ids):
+        if frames and frame_idx == position - 1:
+            # the same frame is sampled twice in spans shorter than num_frames frames
+            frames.append(frames[-1])
+            continue
+
+        gap = frame_idx - position
+        if strategy == "seek":
+            seek = gap != 0
+        elif strategy == "sequential":
+            seek = gap < 0 or (i == 0 and gap > max_grab)
+        else:
+            seek = gap < 0 or gap > max_grab
+        if seek:
+            cv2_vr.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+            position = frame_idx
+        while position < frame_idx and cv2_vr.grab():
+            position += 1
+
+        ok, frame = cv2_vr.read()
+        if not ok:
+            raise ValueError(f"Failed to read frame {frame_idx}")
+        position += 1
+        frames.append(frame)
+    return frames
+
+
+@lru_cache(maxsize=1024)
+def probe_keyframe_interval(video_path, probe_sec=OPENCV_KEYFRAME_PROBE_SEC):
+    """
+    Median seconds between keyframes in the first `probe_sec` seconds of a video, read by ffprobe
+    from packet flags without decoding. None if ffprobe fails or finds less than two keyframes.
+    """
+    command = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-read_intervals", f"%+{probe_sec}",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        str(video_path),
+    ]  # fmt: skip
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    keyframe_times = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            keyframe_times.append(float(pts_time))
+    if len(keyframe_times) < 2:
+        return None
+    # packets are in decoding order
+    return float(np.median(np.diff(sorted(keyframe_times))))
+
+
+def get_video_span(video):
+    """`video` is a path or a `(path, start_sec, end_sec)` tuple for a span of it."""
+    if isinstance(video, tuple):
+        path, start_sec, end_sec = video
+        return str(path), start_sec, end_sec
+    return video, 0.0, None
 
 
 class LanguageBindVideoProcessor(ProcessorMixin):
+    """
+    Videos are decoded and transformed by `num_workers` threads into one batch tensor. Each worker
+    decodes with a single decord thread then, so at most `num_workers` decoding threads run. Inputs
+    are paths or `(path, start_sec, end_sec)` spans; spans of one video are decoded by one worker
+    from a single open of it, so clips need not be cut from source videos first. `opencv_strategy`
+    picks how the opencv backend reaches sampled frames, see `read_opencv_frames`.
+    """
+
     attributes = []
     tokenizer_class = "LanguageBindVideoTokenizer"
 
-    def __init__(self, config, tokenizer=None, **kwargs):
+    def __init__(self, config, tokenizer=None, num_workers=None, opencv_strategy="auto", **kwargs):
         super().__init__(**kwargs)
         self.config = config
         self.transform = get_video_transform(config)
         self.image_processor = load_and_transform_video
+        self.opencv_strategy = opencv_strategy
+        self.loader = ParallelLoader(
+            self._load_spans,
+            num_workers=num_workers,
+            group_by=lambda video: get_video_span(video)[0],
+        )
         self.tokenizer = tokenizer
 
+    def _load_spans(self, videos):
+        spans = [get_video_span(video) for video in videos]
+        return load_and_transform_video_spans(
+            spans[0][0],
+            [(start_sec, end_sec) for _, start_sec, end_sec in spans],
+            self.transform,
+            video_decode_backend=self.config.vision_config.video_decode_backend,
+            num_frames=self.config.vision_config.num_frames,
+            # decord picks the number of threads by cpu count by default
+            decord_num_threads=1 if self.loader.num_workers > 1 else 0,
+            opencv_strategy=self.opencv_strategy,
+        )
+
     def __call__(self, images=None, text=None, context_length=77, return_tensors=None, **kwargs):
         if text is None and images is None:
             raise ValueError("You have to specify either text or images. Both cannot be none.")
@@ -130,16 +297,9 @@ class LanguageBindVideoProcessor(ProcessorMixin):
 
         if images is not None:
             images = make_list_of_images(images)
-            image_features = [
-                self.image_processor(
-                    image,
-                    self.transform,
-                    video_decode_backend=self.config.vision_config.video_decode_backend,
-                    num_frames=self.config.vision_config.num_frames,
-                )
-                for image in images
-            ]
-            image_features = torch.stack(image_features)
+            image_features = self.loader(
+                images, shape=(3, self.config.vision_config.num_frames, 224, 224)
+            )
 
         if text is not None and images is not None:
             encoding["pixel_values"] = image_features
@@ -0,0 +1,40 @@
+import pytest
+import torch
+
+from languagebind.image.configuration_image import LanguageBindImageConfig
+from languagebind.image.modeling_image import LanguageBindImage
+
+
+@pytest.fixture
+def image_model():
+    """
+    A randomly initialized LanguageBindImage small enough to run on CPU in a test. LoRA B weights
+    start at zero, so they are randomized to make the adapters change the outputs.
+    """
+    torch.manual_seed(0)
+    config = LanguageBindImageConfig(
+        text_config={
+            "vocab_size": 100,
+            "hidden_size": 32,
+            "intermediate_size": 64,
+            "num_hidden_layers": 2,
+            "num_attention_heads": 4,
+            "max_position_embeddings": 77,
+            "eos_token_id": 99,
+        },
+        vision_config={
+            "hidden_size": 32,
+            "intermediate_size": 64,
+            "num_hidden_layers": 2,
+            "num_attention_heads": 4,
+            "image_size": 32,
+            "patch_size": 16,
+            "lora_r": 2,
+        },
+        projection_dim=16,
+    )
+    model = LanguageBindImage(config)
+    for name, parameter in model.named_parameters():
+        if "lora_B" in name:
+            torch.nn.init.normal_(parameter, std=0.02)
+    return model.eval()
@@ -0,0 +1,22 @@
+import torch
+from peft import PeftModel
+
+from languagebind.loading import merge_lora_adapters
+
+
+def test_merge_lora_adapters_keeps_image_embeddings(image_model):
+    pixel_values = torch.randn(2, 3, 32, 32)
+    with torch.no_grad():
+        expected = image_model.get_image_features(pixel_values=pixel_values)
+        merge_lora_adapters(image_model)
+        actual = image_model.get_image_features(pixel_values=pixel_values)
+
+    assert not isinstance(image_model.vision_model.encoder, PeftModel)
+    assert not any("lora_" in name for name, _ in image_model.named_parameters())
+    torch.testing.assert_close(actual, expected, rtol=1e-5, atol=1e-5)
+
+
+def test_merge_lora_adapters_is_idempotent(image_model):
+    merged = merge_lora_adapters(image_model)
+    encoder = merged.vision_model.encoder
+    assert merge_lora_adapters(merged).vision_model.encoder is encoder
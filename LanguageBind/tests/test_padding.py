@@ -0,0 +1,24 @@
+import pytest
+import torch
+
+EOS_TOKEN_ID = 99
+
+
+def _pad(queries, length, pad_token_id):
+    input_ids = torch.full((len(queries), length), pad_token_id)
+    attention_mask = torch.zeros((len(queries), length), dtype=torch.long)
+    for i, query in enumerate(queries):
+        input_ids[i, : len(query)] = torch.tensor(query)
+        attention_mask[i, : len(query)] = 1
+    return input_ids, attention_mask
+
+
+@pytest.mark.parametrize("pad_token_id", [0, EOS_TOKEN_ID])
+def test_longest_padding_matches_max_length_padding(image_model, pad_token_id):
+    queries = [[1, 5, 7, EOS_TOKEN_ID], [1, 8, 3, 4, 2, 6, EOS_TOKEN_ID], [1, EOS_TOKEN_ID]]
+    longest = max(len(q) for q in queries)
+    with torch.no_grad():
+        expected = image_model.get_text_features(*_pad(queries, 77, pad_token_id))
+        actual = image_model.get_text_features(*_pad(queries, longest, pad_token_id))
+
+    torch.testing.assert_close(actual, expected, rtol=1e-5, atol=1e-5)
@@ -0,0 +1,51 @@
+import torch
+
+from languagebind.loading import merge_lora_adapters
+from languagebind.tracing import TracedEncoder
+
+
+def test_traced_vision_encoder_matches_eager(image_model, tmp_path):
+    encoder = merge_lora_adapters(image_model).vision_model
+    pixel_values = torch.randn(2, 3, 32, 32)
+    with torch.no_grad():
+        expected = encoder(pixel_values=pixel_values)
+        traced = TracedEncoder(encoder, cache_dir=str(tmp_path), cache_key="image")
+        actual = traced(pixel_values=pixel_values)
+
+    assert len(traced._graphs) == 1
+    assert next(iter(traced._graphs.values())) is not None
+    torch.testing.assert_close(actual[0], expected[0], rtol=1e-5, atol=1e-5)
+    torch.testing.assert_close(actual[1], expected[1], rtol=1e-5, atol=1e-5)
+
+
+def test_traced_text_encoder_matches_eager(image_model, tmp_path):
+    encoder = image_model.text_model
+    input_ids = torch.tensor([[1, 5, 7, 99, 0, 0], [1, 8, 3, 4, 2, 99]])
+    attention_mask = (torch.arange(6) <= input_ids.argmax(-1, keepdim=True)).long()
+    with torch.no_grad():
+        expected = encoder(input_ids=input_ids, attention_mask=attention_mask)
+        traced = TracedEncoder(encoder, cache_dir=str(tmp_path), cache_key="language")
+        actual = traced(input_ids=input_ids, attention_mask=attention_mask)
+
+    assert next(iter(traced._graphs.values())) is not None
+    torch.testing.assert_close(actual[1], expected[1], rtol=1e-5, atol=1e-5)
+
+
+def test_traced_encoder_reuses_cached_graph(image_model, tmp_path):
+    encoder = merge_lora_adapters(image_model).vision_model
+    pixel_values = torch.randn(1, 3, 32, 32)
+    with torch.no_grad():
+        TracedEncoder(encoder, cache_dir=str(tmp_path), cache_key="image")(
+            pixel_values=pixel_values
+        )
+        saved = list(tmp_path.iterdir())
+        # a restarted process loads the saved graph and tracks the live weights
+        torch.nn.init.normal_(encoder.post_layernorm.weight)
+        expected = encoder(pixel_values=pixel_values)
+        actual = TracedEncoder(encoder, cache_dir=str(tmp_path), cache_key="image")(
+            pixel_values=pixel_values
+        )
+
+    assert len(saved) == 1
+    assert list(tmp_path.iterdir()) == saved
+    torch.testing.assert_close(actual[1], expected[1], rtol=1e-5, atol=1e-5)
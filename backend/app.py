@@ -1,3 +1,5 @@
+import hashlib
+import json
 import logging
 from pathlib import Path
 
@@ -5,12 +7,20 @@ import transformers
 from fastapi import FastAPI
 
 from src.config import Config
+from src.entity.embedder.base import Modality, Precision
+from src.entity.embedder.batching import BatchingEmbedder
+from src.entity.embedder.cache import CachingEmbedder
+from src.entity.embedder.language_bind import LanguageBindOptions
 from src.entity.factory import build_embedder, build_searcher, build_storage
+from src.entity.storage.memmap import MemmapStorage
 from src.handler.info import InfoHandler
+from src.handler.metrics import MetricsHandler
 from src.handler.resources import ResourcesHandler
 from src.handler.search.v1 import SearchHandler
 from src.server import AppServer
 from src.types import Collection
+from src.utils.executor import BoundedExecutor
+from src.utils.metrics import IMetricsProvider
 
 transformers.logging.set_verbosity_info()
 logging.basicConfig(level=logging.INFO)
@@ -22,9 +32,51 @@ def get_app() -> FastAPI:
     Config.load(config_file="../config.yaml")
     logger.info("Config: %s", Config.dump())
 
-    embedder = build_embedder(Config.EMBEDDER_TYPE, device=Config.DEVICE)
-    storage = build_storage(Config.STORAGE_TYPE)
+    base_embedder = build_embedder(
+        Config.EMBEDDER_TYPE,
+        device=Config.DEVICE,
+        options=LanguageBindOptions(
+            lazy=Config.EMBEDDER_LAZY_LOADING,
+            preload=tuple(Modality(m) for m in Config.EMBEDDER_PRELOAD or []),
+            memory_budget_mb=Config.EMBEDDER_MEMORY_BUDGET_MB,
+            precision=Precision(Config.EMBEDDER_PRECISION),
+            trace_cache_dir=Path(Config.EMBEDDER_TRACE_CACHE_DIR) if Config.EMBEDDER_TRACE_CACHE_DIR else None,
+        ),
+    )
+    batching_embedder = BatchingEmbedder(
+        base_embedder,
+        window_ms=Config.EMBEDDER_BATCH_WINDOW_MS,
+        max_batch_size=Config.EMBEDDER_MAX_BATCH_SIZE,
+    )
+    # embeddings differ slightly between precisions, padding and other options
+    options = json.dumps(base_embedder.get_options(), sort_keys=True, default=str)
+    embedder = CachingEmbedder(
+        batching_embedder,
+        namespace=f"{Config.EMBEDDER_TYPE}/{hashlib.sha256(options.encode()).hexdigest()[:16]}",
+        maxsize=Config.EMBEDDING_CACHE_SIZE,
+        ttl=Config.EMBEDDING_CACHE_TTL,
+        cache_dir=Path(Config.EMBEDDING_CACHE_DIR) if Config.EMBEDDING_CACHE_DIR else None,
+        disk_maxsize=Config.EMBEDDING_CACHE_DISK_SIZE,
+    )
+    storage = MemmapStorage(
+        build_storage(Config.STORAGE_TYPE),
+        indexes_root=Path(Config.INDEXES_ROOT),
+        model_type=Config.EMBEDDER_TYPE,
+    )
     searcher = build_searcher()
+    inference_executor = BoundedExecutor(
+        "inference", max_workers=Config.INFERENCE_WORKERS, max_queue_size=Config.INFERENCE_QUEUE_SIZE
+    )
+    io_executor = BoundedExecutor("io", max_workers=Config.IO_WORKERS, max_queue_size=Config.IO_QUEUE_SIZE)
+
+    metrics_providers: dict[str, IMetricsProvider] = {
+        "embedder_batching": batching_embedder,
+        "embedding_cache": embedder,
+        "inference_executor": inference_executor,
+        "io_executor": io_executor,
+    }
+    if isinstance(base_embedder, IMetricsProvider):
+        metrics_providers["embedder"] = base_embedder
 
     dataset_paths = {
         Collection(dataset=d["dataset"], version=d["version"]): d["data_path"] for d in Config.DATASETS or []
@@ -35,9 +87,21 @@ def get_app() -> FastAPI:
             embedder=embedder,
             storage=storage,
             searcher=searcher,
+            inference_executor=inference_executor,
+            io_executor=io_executor,
+        ),
+        info_handler=InfoHandler(
+            storage=storage,
+            available_collections=list(dataset_paths.keys()),
+            io_executor=io_executor,
+        ),
+        resources_handler=ResourcesHandler(
+            dataset_paths=dataset_paths,
+            indexes_path=Path(Config.INDEXES_ROOT),
+            io_executor=io_executor,
         ),
-        info_handler=InfoHandler(storage=storage, available_collections=list(dataset_paths.keys())),
-        resources_handler=ResourcesHandler(dataset_paths=dataset_paths, indexes_path=Path(Config.INDEXES_ROOT)),
+        metrics_handler=MetricsHandler(providers=metrics_providers),
+        executors=[inference_executor, io_executor],
     ).create_application()
 
 
@@ -0,0 +1,196 @@
+import argparse
+import hashlib
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from languagebind.video.processing_video import load_and_transform_video_spans
+from tqdm import tqdm
+
+from scripts.compute_embeddings import Mode, find_media_files, get_video_duration, get_video_spans, split_video
+
+DECODE_BACKENDS = ["decord", "opencv-seek", "opencv-sequential", "opencv-auto"]
+
+
+def decode(
+    data_path: Path,
+    backends: list[str],
+    num_frames: int,
+    clip_length: Optional[float],
+    sample_size: int,
+    repeats: int,
+) -> None:
+    print(
+        "####################\n"
+        f"Data Path: {data_path}\n"
+        f"Backends: {backends}\n"
+        f"Num Frames: {num_frames}\n"
+        f"Clip Length: {clip_length}\n"
+        f"Sample Size: {sample_size}\n"
+        f"Repeats: {repeats}\n"
+        "####################"
+    )
+
+    paths = _sample_videos(data_path, sample_size)
+    # whole videos are decoded as one clip without clip length
+    spans = {
+        path: [tuple(s["span"]) for s in get_video_spans(path, clip_length)] if clip_length else [(0.0, None)]
+        for path in tqdm(paths, desc="spans")
+    }
+    clips_count = sum(len(s) for s in spans.values())
+    print(f'Sampled "{len(paths)}" videos with "{clips_count}" clips')
+
+    results = {}
+    for backend in backends:
+        seconds, digests = 0.0, []
+        for path in tqdm(paths, desc=backend):
+            timings = []
+            for _ in range(repeats):
+                timing, path_digests = _decode(path, spans[path], backend=backend, num_frames=num_frames)
+                timings.append(timing)
+            seconds += min(timings)
+            digests += path_digests
+        results[backend] = (seconds, digests)
+
+    # opencv strategies differ only in how frames are reached, so they should decode the same frames
+    reference = "opencv-seek" if "opencv-seek" in results else backends[0]
+    print(f"Decoding {num_frames} frames per clip, same frames compared to {reference}:")
+    for backend, (seconds, digests) in results.items():
+        same = sum(a == b for a, b in zip(digests, results[reference][1])) / clips_count
+        print(
+            f"  {backend}: {seconds / clips_count * 1000:.1f}ms per clip, "
+            f"{clips_count / seconds:.1f} clips/s, same frames {same:.0%}"
+        )
+    print("Done!")
+
+
+def clip_timing(data_path: Path, clip_length: float, sample_size: int) -> None:
+    print(
+        "####################\n"
+        f"Data Path: {data_path}\n"
+        f"Clip Length: {clip_length}\n"
+        f"Sample Size: {sample_size}\n"
+        "####################"
+    )
+
+    paths = _sample_videos(data_path, sample_size)
+    split_seconds, clip_probe_seconds, source_probe_seconds = 0.0, 0.0, 0.0
+    clips_count, max_difference = 0, 0.0
+    with tempfile.TemporaryDirectory() as output_path:
+        for path in tqdm(paths, desc="clip timing"):
+            start = time.perf_counter()
+            segments = split_video(path, Path(output_path), clip_length)
+            split_seconds += time.perf_counter() - start
+
+            # spans from durations of clips, one ffprobe per clip
+            start = time.perf_counter()
+            durations = [get_video_duration(clip_path) for clip_path, _, _ in segments]
+            clip_probe_seconds += time.perf_counter() - start
+
+            # spans without clips, one ffprobe per video
+            start = time.perf_counter()
+            get_video_spans(path, clip_length)
+            source_probe_seconds += time.perf_counter() - start
+
+            end = 0.0
+            for (clip_path, _segment_start, segment_end), duration in zip(segments, durations):
+                end += duration
+                max_difference = max(max_difference, abs(end - (segment_end - segments[0][1])))
+                clip_path.unlink()
+            clips_count += len(segments)
+
+    print(f'Timed "{len(paths)}" videos with "{clips_count}" clips, per video:')
+    print(f"  ffmpeg split: {split_seconds / len(paths) * 1000:.1f}ms")
+    print(f"  clip timing from ffprobe per clip: {clip_probe_seconds / len(paths) * 1000:.1f}ms")
+    print("  clip timing from the ffmpeg segment list: no extra processes")
+    print(f"  spans from ffprobe per video: {source_probe_seconds / len(paths) * 1000:.1f}ms")
+    print(f"Max clip end difference between ffprobe and the segment list: {max_difference:.3f}s")
+    print("Done!")
+
+
+def _sample_videos(data_path: Path, sample_size: int) -> list[Path]:
+    paths = sorted(find_media_files(directory=data_path, extensions=Mode.VIDEO.get_extentions()))
+    paths = random.Random(0).sample(paths, min(sample_size, len(paths)))
+    if not paths:
+        raise ValueError(f"No video files found in directory: {data_path}.")
+    return paths
+
+
+def _decode(path: Path, spans: list[tuple], backend: str, num_frames: int) -> tuple[float, list[str]]:
+    """Decoding time of all spans of a video, without transforms, and digests of decoded frames."""
+    video_decode_backend, _, opencv_strategy = backend.partition("-")
+    clips = load_and_transform_video_spans(
+        str(path),
+        spans,
+        transform=lambda frames: frames,
+        video_decode_backend=video_decode_backend,
+        num_frames=num_frames,
+        opencv_strategy=opencv_strategy or "auto",
+    )
+    seconds, digests = 0.0, []
+    while True:
+        start = time.perf_counter()
+        frames = next(clips, None)
+        seconds += time.perf_counter() - start
+        if frames is None:
+            break
+        digests.append(hashlib.sha256(frames.numpy().tobytes()).hexdigest())
+    return seconds, digests
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark media preprocessing.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    decode_parser = subparsers.add_parser("decode", help="Compare video decoding backends on sample files.")
+    decode_parser.add_argument(
+        "--data-path", "-p", type=Path, required=True, help="Path to the directory with video files."
+    )
+    decode_parser.add_argument(
+        "--backends",
+        type=str,
+        nargs="+",
+        choices=DECODE_BACKENDS,
+        default=DECODE_BACKENDS,
+        help="Video decoding backends, opencv with a frame seeking strategy.",
+    )
+    decode_parser.add_argument("--num-frames", type=int, default=8, help="Number of frames sampled per clip.")
+    decode_parser.add_argument(
+        "--clip-length",
+        "-cl",
+        type=float,
+        default=None,
+        help="Decode spans of this length (in seconds) from each video, whole videos otherwise.",
+    )
+    decode_parser.add_argument("--sample-size", "-s", type=int, default=16, help="Number of sampled videos.")
+    decode_parser.add_argument("--repeats", type=int, default=3, help="Decoding repeats, the fastest one counts.")
+
+    clip_timing_parser = subparsers.add_parser(
+        "clip-timing", help="Compare ways to get timing of clips split from sample videos."
+    )
+    clip_timing_parser.add_argument(
+        "--data-path", "-p", type=Path, required=True, help="Path to the directory with video files."
+    )
+    clip_timing_parser.add_argument(
+        "--clip-length", "-cl", type=float, default=5.0, help="Length of clips (in seconds)."
+    )
+    clip_timing_parser.add_argument("--sample-size", "-s", type=int, default=16, help="Number of sampled videos.")
+
+    args = parser.parse_args()
+    if args.command == "decode":
+        decode(
+            data_path=args.data_path,
+            backends=args.backends,
+            num_frames=args.num_frames,
+            clip_length=args.clip_length,
+            sample_size=args.sample_size,
+            repeats=args.repeats,
+        )
+    elif args.command == "clip-timing":
+        clip_timing(data_path=args.data_path, clip_length=args.clip_length, sample_size=args.sample_size)
+
+
+if __name__ == "__main__":
+    run()
@@ -1,7 +1,11 @@
 import argparse
+import csv
 import json
+import math
 import subprocess
-from collections.abc import Generator
+import zlib
+from collections.abc import Callable, Generator, Iterable
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
@@ -13,8 +17,11 @@ import yaml
 from more_itertools import chunked
 from tqdm import tqdm
 
-from src.entity.embedder.base import EmbedderType, Modality
+from src.entity.embedder.base import EmbedderType, IEmbedder, Modality
+from src.entity.embedder.language_bind import LanguageBindOptions
 from src.entity.factory import build_embedder
+from src.utils.metrics import IMetricsProvider
+from src.utils.pipeline import Pipeline, Stage
 
 
 class Mode(str, Enum):
@@ -37,6 +44,15 @@ class Mode(str, Enum):
         }[self]
 
 
+# sample rate of the audio model, so audio decoded from videos need not be resampled
+AUDIO_SAMPLE_RATE = 16000
+
+
+class SplitStrategy(str, Enum):
+    FFMPEG = "ffmpeg"  # cut clip files with ffmpeg
+    SPANS = "spans"  # decode clips as spans of source videos, without writing clip files
+
+
 def main(
     indexes_root: Path,
     dataset_path: Path,
@@ -47,6 +63,14 @@ def main(
     clip_length: float,
     device: str,
     batch_size: int,
+    token_merging_ratio: Optional[float] = None,
+    preprocess_workers: Optional[int] = None,
+    image_draft: bool = False,
+    split_strategy: SplitStrategy = SplitStrategy.FFMPEG,
+    queue_size: int = 2,
+    num_shards: int = 1,
+    shard_index: int = 0,
+    resume: bool = False,
 ) -> None:
     print(
         "####################\n"
@@ -57,10 +81,20 @@ def main(
         f"Mode: {mode}\n"
         f"Model: {model_type}\n"
         f"Clip Length: {clip_length}\n"
+        f"Split Strategy: {split_strategy}\n"
         f"Device: {device}\n"
         f"Batch Size: {batch_size}\n"
+        f"Token Merging Ratio: {token_merging_ratio}\n"
+        f"Preprocess Workers: {preprocess_workers}\n"
+        f"Image Draft: {image_draft}\n"
+        f"Queue Size: {queue_size}\n"
+        f"Num Shards: {num_shards}\n"
+        f"Shard Index: {shard_index}\n"
+        f"Resume: {resume}\n"
         "####################"
     )
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"Shard index should be in [0, {num_shards}), got {shard_index}")
 
     if model_type == EmbedderType.LANGUAGE_BIND and device == "cuda" and not torch.cuda.is_available():
         torch.tensor([], device="cuda")
@@ -73,151 +107,115 @@ def main(
             f"No {mode.get_modalities()} files found in directory: {dataset_path}. "
             "Please check the dataset path and modality."
         )
+    if num_shards > 1:
+        # an empty shard still saves its labels and metadata, so the shards can be merged
+        media_paths = get_shard_media_files(media_paths, dataset_path, num_shards=num_shards, shard_index=shard_index)
+        print(f'Shard "{shard_index}" of "{num_shards}" has "{len(media_paths)}" {mode} files')
 
     index_path = indexes_root / dataset_name / dataset_version
+    if num_shards > 1:
+        # shards are combined into the index by merge_embeddings
+        index_path = get_shard_path(index_path, shard_index=shard_index, num_shards=num_shards)
     tmp_path = index_path / ".tmp"
     (tmp_path / "embeddings").mkdir(parents=True, exist_ok=True)
     (tmp_path / "clips").mkdir(parents=True, exist_ok=True)
-    (tmp_path / "audios").mkdir(parents=True, exist_ok=True)
+    # settings that change clips or embeddings, a run can be resumed only with the same ones
+    manifest = Manifest(
+        tmp_path / "manifest.jsonlines",
+        dataset_path=dataset_path,
+        settings={
+            "Dataset Path": str(dataset_path),
+            "Mode": str(mode),
+            "Model": str(model_type),
+            "Clip Length": clip_length,
+            "Split Strategy": str(split_strategy),
+            "Token Merging Ratio": token_merging_ratio,
+            "Image Draft": image_draft,
+        },
+        resume=resume,
+    )
+    # labels and errors of saved jobs are written again with their embeddings
     labels_path = index_path / "labels.jsonlines"
     labels_path.open("w").close()
     errors_path = index_path / "errors.jsonlines"
     errors_path.open("w").close()
 
     print("Loading model...")
-    embedder = build_embedder(embedder_type=model_type, device=device)
+    embedder = build_embedder(
+        embedder_type=model_type,
+        device=device,
+        options=LanguageBindOptions(
+            token_merging_ratio=token_merging_ratio,
+            preprocess_workers=preprocess_workers,
+            image_draft=image_draft,
+        ),
+    )
 
     print(f'Computing embeddings to "{index_path}"...')
     embeddings: dict[Modality, list] = {modality: [] for modality in mode.get_modalities()}
+    if manifest.records:
+        print(f'Resuming after "{len(manifest.records)}" saved batches')
+        restore_saved_jobs(
+            manifest,
+            embeddings=embeddings,
+            model_type=model_type,
+            tmp_path=tmp_path,
+            labels_path=labels_path,
+            errors_path=errors_path,
+        )
+    batches: Iterable[Union[list[dict], dict]]
     if mode == Mode.IMAGE:
-        for i, batch in enumerate(tqdm(list(chunked(media_paths, n=batch_size)))):
-            try:
-                image_embeddings = (
-                    embedder.embed([str(path) for path in batch], modality=Modality.IMAGE).detach().cpu().numpy()
-                )
-            except Exception as e:
-                print(f"Batch skipped! Exception while processing image batch {i}")
-                for path in batch:
-                    write_error(errors_path, media_path=path.relative_to(dataset_path), message=str(e))
-                continue
-            np.save(tmp_path / "embeddings" / f"{model_type}_{Modality.IMAGE}_embeddings.{i}", image_embeddings)
-            embeddings[Modality.IMAGE].append(image_embeddings)
-            for path in batch:
-                write_labels(labels_path, media_path=path.relative_to(dataset_path))
-    elif mode == mode.VIDEO:
-        for i, clips_info in enumerate(
-            clip_generator(
-                media_paths, output_path=(tmp_path / "clips"), batch_size=batch_size, clip_length=clip_length
-            )
-        ):
-            if isinstance(clips_info, dict):
-                clip_info = clips_info
-                write_error(
-                    errors_path,
-                    media_path=clip_info["media_path"].relative_to(dataset_path),
-                    message=clip_info["error"],
-                )
-                continue
-
-            try:
-                video_embeddings = (
-                    embedder.embed([str(clip["clip_path"]) for clip in clips_info], modality=Modality.VIDEO)
-                    .detach()
-                    .cpu()
-                    .numpy()
-                )
-            except Exception as e:
-                print(f"Batch skipped! Exception while processing video batch {i}")
-                for clip_info in clips_info:
-                    write_error(
-                        errors_path, media_path=clip_info["media_path"].relative_to(dataset_path), message=str(e)
-                    )
-                continue
-            np.save(tmp_path / "embeddings" / f"{model_type}_{Modality.VIDEO}_embeddings.{i}", video_embeddings)
-            embeddings[Modality.VIDEO].append(video_embeddings)
-            for clip_info in clips_info:
-                write_labels(
-                    labels_path, media_path=clip_info["media_path"].relative_to(dataset_path), span=clip_info["span"]
-                )
-                if clip_info["clip_path"].exists():
-                    clip_info["clip_path"].unlink()
-    elif mode == mode.VIDEO_WITH_AUDIO:
-        for i, clips_info in enumerate(
-            clip_generator(
-                media_paths, output_path=(tmp_path / "clips"), batch_size=batch_size, clip_length=clip_length
-            )
-        ):
-            if isinstance(clips_info, dict):
-                clip_info = clips_info
-                write_error(
-                    errors_path,
-                    media_path=clip_info["media_path"].relative_to(dataset_path),
-                    message=clip_info["error"],
-                )
-                continue
-
-            # Video
-            try:
-                video_embeddings = (
-                    embedder.embed([str(clip["clip_path"]) for clip in clips_info], modality=Modality.VIDEO)
-                    .detach()
-                    .cpu()
-                    .numpy()
-                )
-            except Exception as e:
-                print(f"Batch skipped! Exception while processing video batch {i}")
-                for clip_info in clips_info:
-                    write_error(
-                        errors_path, media_path=clip_info["media_path"].relative_to(dataset_path), message=str(e)
-                    )
-                continue
-
-            # Audio
-            try:
-                audio_paths = []
-                valid_indexes_mask = []
-                for j, clip in enumerate(clips_info):
-                    try:
-                        audio_path = extract_audio(clip["clip_path"], output_path=(tmp_path / "audios"))
-                        audio_paths.append(str(audio_path))
-                        valid_indexes_mask.append(j)
-                    except Exception:
-                        print(f'Video {clip["clip_path"]} does not have audio stream')
-                audio_embeddings = np.zeros((len(clips_info), video_embeddings.shape[1]))
-                if audio_paths:
-                    audio_embeddings[valid_indexes_mask] = (
-                        embedder.embed(audio_paths, modality=Modality.AUDIO).detach().cpu().numpy()
-                    )
-            except Exception as e:
-                print(f"Batch skipped! Exception while processing audio batch {i}")
-                for clip_info in clips_info:
-                    write_error(
-                        errors_path, media_path=clip_info["media_path"].relative_to(dataset_path), message=str(e)
-                    )
-                continue
-
-            np.save(tmp_path / "embeddings" / f"{model_type}_{Modality.VIDEO}_embeddings.{i}", video_embeddings)
-            embeddings[Modality.VIDEO].append(video_embeddings)
-
-            np.save(tmp_path / "embeddings" / f"{model_type}_{Modality.AUDIO}_embeddings.{i}", audio_embeddings)
-            embeddings[Modality.AUDIO].append(audio_embeddings)
-
-            for clip_info in clips_info:
-                write_labels(
-                    labels_path, media_path=clip_info["media_path"].relative_to(dataset_path), span=clip_info["span"]
-                )
-                if clip_info["clip_path"].exists():
-                    clip_info["clip_path"].unlink()
-            for path in audio_paths:
-                if Path(path).exists():
-                    Path(path).unlink()
+        unsaved_paths = [path for path in media_paths if not manifest.is_saved(path)]
+        batches = (
+            [{"media_path": path, "clip_path": None, "input": str(path), "span": None} for path in batch]
+            for batch in tqdm(list(chunked(unsaved_paths, n=batch_size)))
+        )
+    elif mode in (Mode.VIDEO, Mode.VIDEO_WITH_AUDIO):
+        split = get_clip_splitter(split_strategy, output_path=(tmp_path / "clips"), clip_length=clip_length)
+        batches = clip_generator(media_paths, batch_size=batch_size, split=manifest.skip_saved(split))
     else:
         raise NotImplementedError
 
+    # splitting, preprocessing, inference and saving of consecutive batches overlap
+    source_audio = SourceAudio(sample_rate=AUDIO_SAMPLE_RATE)
+    pipeline = Pipeline(
+        stages=[
+            Stage("preprocess", lambda job: preprocess_job(job, embedder=embedder, mode=mode, audio=source_audio)),
+            Stage("inference", lambda job: embed_job(job, embedder=embedder)),
+            Stage(
+                "save",
+                lambda job: save_job(
+                    job,
+                    embeddings=embeddings,
+                    model_type=model_type,
+                    dataset_path=dataset_path,
+                    tmp_path=tmp_path,
+                    labels_path=labels_path,
+                    errors_path=errors_path,
+                    manifest=manifest,
+                ),
+            ),
+        ],
+        queue_size=queue_size,
+        source_name="split",
+    )
+    pipeline.run(Job(index=i, clips=batch) for i, batch in enumerate(batches, start=manifest.next_batch_index))
+
+    # the slowest stage is busy all the time and sets the indexing time, stages with full queues wait for it
+    print("Throughput:")
+    metrics = pipeline.get_metrics()
+    if isinstance(embedder, IMetricsProvider):
+        metrics.update(embedder.get_metrics())
+    for name, value in metrics.items():
+        print(f"  {name}: {value:.2f}")
+
     emb_shapes = {}
     for modality in mode.get_modalities():
         if modality == Modality.HYBRID:
             continue
+        if not embeddings[modality]:
+            print(f"No {modality.value} embeddings computed")
+            continue
         modality_embeddings = np.vstack(embeddings[modality])
         emb_shapes[str(modality.value)] = modality_embeddings.shape
         np.save(index_path / f"{model_type}_{modality}_embeddings.npy", modality_embeddings)
@@ -252,8 +250,16 @@ def main(
                     "Mode": str(mode),
                     "Model": str(model_type),
                     "Clip Length": clip_length,
+                    "Split Strategy": str(split_strategy),
                     "Device": device,
                     "Batch Size": batch_size,
+                    "Token Merging Ratio": token_merging_ratio,
+                    "Preprocess Workers": preprocess_workers,
+                    "Image Draft": image_draft,
+                    "Queue Size": queue_size,
+                    "Num Shards": num_shards,
+                    "Shard Index": shard_index,
+                    "Resume": resume,
                 },
             },
             file,
@@ -264,16 +270,259 @@ def main(
     print("Done!")
 
 
+@dataclass
+class Job:
+    index: int
+    # clips of the batch, or an error of splitting a media file
+    clips: Union[list[dict], dict]
+    inputs: dict[Modality, torch.Tensor] = field(default_factory=dict)
+    # indexes of clips with inputs of a modality, e.g. clips with audio
+    indexes: dict[Modality, list[int]] = field(default_factory=dict)
+    embeddings: dict[Modality, np.ndarray] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+class SourceAudio:
+    """
+    Audio of clips decoded from their source videos in one ffmpeg pass per source and batch, over the time range of
+    the source clips in the batch, so memory is bounded by the batch duration instead of the source duration.
+    Sources without audio stream or failing to decode give no waveforms, so only their clips get no audio embeddings.
+    """
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self._has_audio: dict[Path, bool] = {}
+
+    def get_batch(self, clips: list[dict]) -> list[Optional[torch.Tensor]]:
+        """Waveforms of clip spans, None for clips without audio."""
+        spans: dict[Path, list[tuple[float, float]]] = {}
+        for clip in clips:
+            spans.setdefault(clip["media_path"], []).append(clip["span"])
+        # clips come in source order, so previous sources have no clips left
+        self._has_audio = {path: has_audio for path, has_audio in self._has_audio.items() if path in spans}
+
+        audios: dict[Path, tuple[float, Optional[torch.Tensor]]] = {}
+        for media_path, source_spans in spans.items():
+            start, end = min(span[0] for span in source_spans), max(span[1] for span in source_spans)
+            try:
+                if media_path not in self._has_audio:
+                    self._has_audio[media_path] = has_audio_stream(media_path)
+                audio = (
+                    load_audio(media_path, sample_rate=self.sample_rate, start=start, end=end)
+                    if self._has_audio[media_path]
+                    else None
+                )
+            except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                print(f'Audio of "{media_path}" skipped! Exception while decoding it: {e}')
+                self._has_audio[media_path] = False
+                audio = None
+            audios[media_path] = (start, audio)
+
+        waveforms = []
+        for clip in clips:
+            start, audio = audios[clip["media_path"]]
+            span = (clip["span"][0] - start, clip["span"][1] - start)
+            waveforms.append(get_audio_span(audio, span=span, sample_rate=self.sample_rate))
+        return waveforms
+
+
+class Manifest:
+    """
+    Jobs saved by a run, one json line per job appended once its embeddings, labels and errors are saved. A resumed
+    run skips media files and clips of saved jobs and restores their embeddings from the saved batch files.
+    """
+
+    def __init__(self, path: Path, dataset_path: Path, settings: dict[str, Any], resume: bool):
+        self.path = path
+        self.dataset_path = dataset_path
+        self.records: list[dict] = []
+        if resume and path.exists():
+            self.records = self._read(settings)
+        with path.open("w") as f:
+            f.write(json.dumps({"settings": settings}) + "\n")
+            f.writelines(json.dumps(record) + "\n" for record in self.records)
+        self._saved_media = {media_path for record in self.records for media_path in record["media_paths"]}
+        self._saved_clips = {(clip["path"], tuple(clip["span"])) for record in self.records for clip in record["clips"]}
+
+    @property
+    def next_batch_index(self) -> int:
+        return max((record["batch"] for record in self.records), default=-1) + 1
+
+    def is_saved(self, media_path: Path, span: Optional[list[float]] = None) -> bool:
+        path = self._relative(media_path)
+        return path in self._saved_media or (span is not None and (path, tuple(span)) in self._saved_clips)
+
+    def skip_saved(self, split: Callable[[Path], list[dict]]) -> Callable[[Path], list[dict]]:
+        """Wraps `split` to skip saved media files and clips, and to mark the last clip of each media file."""
+
+        def split_unsaved(media_path: Path) -> list[dict]:
+            if self.is_saved(media_path):
+                return []
+            clips = split(media_path)
+            if clips:
+                # the media file is saved with its last clip
+                clips[-1]["last"] = True
+            unsaved_clips = []
+            for clip in clips:
+                if self.is_saved(media_path, span=clip["span"]):
+                    if clip["clip_path"]:
+                        clip["clip_path"].unlink(missing_ok=True)
+                else:
+                    unsaved_clips.append(clip)
+            return unsaved_clips
+
+        return split_unsaved
+
+    def add(self, job: "Job") -> None:
+        if isinstance(job.clips, dict):
+            clips, media_paths = [], [job.clips["media_path"]]
+            error: Optional[str] = job.clips["error"]
+        else:
+            clips = [clip for clip in job.clips if clip["span"] is not None]
+            media_paths = [clip["media_path"] for clip in job.clips if clip["span"] is None or clip.get("last")]
+            error = job.error
+        record = {
+            "batch": job.index,
+            "clips": [{"path": self._relative(clip["media_path"]), "span": clip["span"]} for clip in clips],
+            "media_paths": [self._relative(media_path) for media_path in media_paths],
+            "error": error,
+        }
+        with self.path.open("a") as f:
+            f.write(json.dumps(record) + "\n")
+        self.records.append(record)
+
+    def _relative(self, media_path: Path) -> str:
+        return str(media_path.relative_to(self.dataset_path))
+
+    def _read(self, settings: dict[str, Any]) -> list[dict]:
+        with self.path.open() as f:
+            lines = f.read().splitlines()
+        saved_settings = json.loads(lines[0])["settings"]
+        if saved_settings != json.loads(json.dumps(settings)):
+            raise ValueError(f"Run can not be resumed with different settings, saved ones are: {saved_settings}")
+        records = []
+        for line in lines[1:]:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break  # the last line is cut off if the run was killed while writing it
+        return records
+
+
+def restore_saved_jobs(
+    manifest: Manifest,
+    embeddings: dict[Modality, list],
+    model_type: EmbedderType,
+    tmp_path: Path,
+    labels_path: Path,
+    errors_path: Path,
+) -> None:
+    for record in manifest.records:
+        if record["error"] is not None:
+            # clips of a failed batch, or a media file failed to split
+            for path in [clip["path"] for clip in record["clips"]] or record["media_paths"]:
+                write_error(errors_path, media_path=Path(path), message=record["error"])
+            continue
+        for modality in embeddings:
+            if modality == Modality.HYBRID:
+                continue
+            batch_path = tmp_path / "embeddings" / f"{model_type}_{modality}_embeddings.{record['batch']}.npy"
+            embeddings[modality].append(np.load(batch_path))
+        # images have no spans, their clips are the media files
+        for clip in record["clips"] or [{"path": path, "span": None} for path in record["media_paths"]]:
+            write_labels(labels_path, media_path=Path(clip["path"]), span=clip["span"])
+
+
+def preprocess_job(job: Job, embedder: IEmbedder, mode: Mode, audio: SourceAudio) -> Job:
+    if isinstance(job.clips, dict):
+        return job
+
+    modality = Modality.IMAGE if mode == Mode.IMAGE else Modality.VIDEO
+    try:
+        job.inputs[modality] = embedder.preprocess([clip["input"] for clip in job.clips], modality=modality)
+        job.indexes[modality] = list(range(len(job.clips)))
+    except Exception as e:
+        print(f"Batch skipped! Exception while processing {modality.value} batch {job.index}")
+        job.error = str(e)
+        return job
+
+    if mode == Mode.VIDEO_WITH_AUDIO:
+        try:
+            audio_inputs = []
+            job.indexes[Modality.AUDIO] = []
+            for j, (clip, waveform) in enumerate(zip(job.clips, audio.get_batch(job.clips))):
+                if waveform is None:
+                    print(f'Video {clip["media_path"]} does not have audio stream at {clip["span"]}')
+                    continue
+                audio_inputs.append((waveform, audio.sample_rate))
+                job.indexes[Modality.AUDIO].append(j)
+            if audio_inputs:
+                job.inputs[Modality.AUDIO] = embedder.preprocess(audio_inputs, modality=Modality.AUDIO)
+        except Exception as e:
+            print(f"Batch skipped! Exception while processing audio batch {job.index}")
+            job.error = str(e)
+    return job
+
+
+def embed_job(job: Job, embedder: IEmbedder) -> Job:
+    if isinstance(job.clips, dict) or job.error:
+        return job
+
+    for modality, inputs in job.inputs.items():
+        try:
+            job.embeddings[modality] = embedder.embed(inputs, modality=modality).detach().cpu().numpy()
+        except Exception as e:
+            print(f"Batch skipped! Exception while processing {modality.value} batch {job.index}")
+            job.error = str(e)
+            return job
+
+    if Modality.AUDIO in job.indexes:
+        # clips without audio get zero embeddings
+        video_embeddings = job.embeddings[Modality.VIDEO]
+        audio_embeddings = np.zeros((len(job.clips), video_embeddings.shape[1]))
+        if Modality.AUDIO in job.embeddings:
+            audio_embeddings[job.indexes[Modality.AUDIO]] = job.embeddings[Modality.AUDIO]
+        job.embeddings[Modality.AUDIO] = audio_embeddings
+    return job
+
+
+def save_job(
+    job: Job,
+    embeddings: dict[Modality, list],
+    model_type: EmbedderType,
+    dataset_path: Path,
+    tmp_path: Path,
+    labels_path: Path,
+    errors_path: Path,
+    manifest: Manifest,
+) -> None:
+    if isinstance(job.clips, dict):
+        media_path = job.clips["media_path"].relative_to(dataset_path)
+        write_error(errors_path, media_path=media_path, message=job.clips["error"])
+        manifest.add(job)
+        return
+
+    if job.error is None:
+        for modality, modality_embeddings in job.embeddings.items():
+            np.save(tmp_path / "embeddings" / f"{model_type}_{modality}_embeddings.{job.index}", modality_embeddings)
+            embeddings[modality].append(modality_embeddings)
+    for clip in job.clips:
+        if job.error is None:
+            write_labels(labels_path, media_path=clip["media_path"].relative_to(dataset_path), span=clip["span"])
+        else:
+            write_error(errors_path, media_path=clip["media_path"].relative_to(dataset_path), message=job.error)
+        if clip["clip_path"] and clip["clip_path"].exists():
+            clip["clip_path"].unlink()
+    manifest.add(job)
+
+
 def clip_generator(
-    paths: list[Path], output_path: Path, batch_size: int, clip_length: float
+    paths: list[Path], batch_size: int, split: Callable[[Path], list[dict]]
 ) -> Generator[Union[list[dict], dict], None, None]:
     buffer = []
     for path in tqdm(paths):
         try:
-            clip_paths_and_timings = get_video_clips_with_timing(
-                input_path=path, output_path=output_path, segment_duration=clip_length
-            )
-            buffer += clip_paths_and_timings
+            buffer += split(path)
         except Exception as e:
             print(f"Error processing {path}: {e}")
             yield {"media_path": path, "error": str(e)}
@@ -287,6 +536,18 @@ def clip_generator(
         yield buffer
 
 
+def get_clip_splitter(
+    split_strategy: SplitStrategy, output_path: Path, clip_length: float
+) -> Callable[[Path], list[dict]]:
+    if split_strategy == SplitStrategy.FFMPEG:
+        return lambda path: get_video_clips_with_timing(
+            input_path=path, output_path=output_path, segment_duration=clip_length
+        )
+    if split_strategy == SplitStrategy.SPANS:
+        return lambda path: get_video_spans(input_path=path, segment_duration=clip_length)
+    raise NotImplementedError
+
+
 def write_error(errors_path: Path, media_path: Path, message: str) -> None:
     with errors_path.open("a") as f:
         json_line = json.dumps({"path": str(media_path), "error": message})
@@ -306,21 +567,57 @@ def find_media_files(directory: Path, extensions: list[str]) -> list[Path]:
     return [file_path for file_path in directory.rglob("*") if file_path.suffix.lower() in extensions]
 
 
+def get_shard_media_files(media_paths: list[Path], dataset_path: Path, num_shards: int, shard_index: int) -> list[Path]:
+    """
+    Media files of a shard. Files are assigned to shards by a hash of their path relative to the dataset, so every
+    process and machine gets the same partitioning without coordination.
+    """
+    return [
+        path
+        for path in media_paths
+        if zlib.crc32(path.relative_to(dataset_path).as_posix().encode()) % num_shards == shard_index
+    ]
+
+
+def get_shard_path(index_path: Path, shard_index: int, num_shards: int) -> Path:
+    return index_path / "shards" / f"{shard_index:03d}-of-{num_shards:03d}"
+
+
 def get_video_clips_with_timing(input_path: Path, output_path: Path, segment_duration: float = 5) -> list[dict]:
     video_segments = []
-    start_time = 0.0
+    segments = split_video(input_path, output_path, segment_duration)
+    # segment times are in the source timeline, which may not start at zero
+    offset = segments[0][1] if segments else 0.0
+    for clip_path, start_time, end_time in segments:
+        span = [round(start_time - offset, 2), round(end_time - offset, 2)]
+        video_segments.append({"media_path": input_path, "clip_path": clip_path, "input": str(clip_path), "span": span})
+
+    return video_segments
 
-    for clip_path in split_video(input_path, output_path, segment_duration):
-        duration = get_video_duration(clip_path)
-        end_time = round(start_time + duration, 2)
-        start_time = round(start_time, 2)
-        video_segments.append({"media_path": input_path, "clip_path": clip_path, "span": [start_time, end_time]})
-        start_time = end_time
 
+def get_video_spans(input_path: Path, segment_duration: float = 5) -> list[dict]:
+    duration = get_video_duration(input_path)
+    video_segments = []
+    for i in range(math.ceil(duration / segment_duration)):
+        start_time = round(i * segment_duration, 2)
+        end_time = round(min((i + 1) * segment_duration, duration), 2)
+        video_segments.append(
+            {
+                "media_path": input_path,
+                "clip_path": None,
+                "input": (str(input_path), start_time, end_time),
+                "span": [start_time, end_time],
+            }
+        )
     return video_segments
 
 
-def split_video(input_path: Path, output_path: Path, segment_duration: float) -> list[Path]:
+def split_video(input_path: Path, output_path: Path, segment_duration: float) -> list[tuple[Path, float, float]]:
+    """
+    Splits a video into clips of about `segment_duration` seconds and returns them in order with their start and end
+    times, taken from the segment list written by ffmpeg instead of probing each clip.
+    """
+    segment_list_path = output_path / f"{input_path.stem}.segments.csv"
     command = [
         "ffmpeg", "-y",
         "-fflags", "+genpts",
@@ -328,6 +625,8 @@ def split_video(input_path: Path, output_path: Path, segment_duration: float) ->
         "-map", "0",
         "-segment_time", str(segment_duration),
         "-f", "segment",
+        "-segment_list", str(segment_list_path),
+        "-segment_list_type", "csv",
         "-reset_timestamps", "1",
         "-c:v", "copy",
         "-c:a", "copy",
@@ -345,33 +644,60 @@ def split_video(input_path: Path, output_path: Path, segment_duration: float) ->
     if result.returncode != 0:
         raise ValueError(f"FFmpeg error: {result.stderr}")
 
-    return list(output_path.glob(f"{input_path.stem}.clip*{input_path.suffix}"))
+    try:
+        with segment_list_path.open(newline="") as f:
+            return [(output_path / name, float(start), float(end)) for name, start, end in csv.reader(f)]
+    finally:
+        segment_list_path.unlink(missing_ok=True)
 
 
-def extract_audio(input_path: Path, output_path: Path) -> Path:
+def load_audio(input_path: Path, sample_rate: int, start: float, end: float) -> torch.Tensor:
+    """Decodes the first audio channel of a media file from `start` to `end` seconds as a (1, samples) waveform."""
     command = [
         "ffmpeg",
-        "-y",
-        "-i",
-        str(input_path),
-        "-vn",
-        "-acodec",
-        "pcm_s16le",
-        "-ar",
-        "44100",
-        "-loglevel",
-        "error",
+        "-ss", str(start),
+        "-t", str(end - start),
+        "-i", str(input_path),
+        "-map", "0:a:0",
+        "-af", "pan=mono|c0=c0",  # the audio model uses the first channel
+        "-ar", str(sample_rate),
+        "-f", "s16le",
+        "-acodec", "pcm_s16le",
+        "-loglevel", "error",
         "-nostats",
-    ]
+        "pipe:1",
+    ]  # fmt: skip
 
-    output_file = output_path / f"{input_path.stem}.audio.wav"
-    command += [str(output_file)]
+    result = subprocess.run(command, capture_output=True, check=False)
+    if result.returncode != 0:
+        raise ValueError(f"FFmpeg error: {result.stderr.decode(errors='replace')}")
+    samples = np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768
+    return torch.from_numpy(samples).unsqueeze(0)
+
+
+def has_audio_stream(file_path: Path) -> bool:
+    command = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries", "stream=index",
+        "-of", "csv=p=0",
+        str(file_path),
+    ]  # fmt: skip
 
     result = subprocess.run(command, capture_output=True, text=True, check=True)
-    if result.returncode != 0:
-        raise ValueError(f"FFmpeg error: {result.stderr}")
+    return bool(result.stdout.strip())
+
 
-    return output_file
+def get_audio_span(
+    audio: Optional[torch.Tensor], span: tuple[float, float], sample_rate: int
+) -> Optional[torch.Tensor]:
+    if audio is None:
+        return None
+    start, end = round(span[0] * sample_rate), round(span[1] * sample_rate)
+    audio = audio[:, start:end]
+    # fbank needs at least one 25 ms frame
+    return audio if audio.shape[1] >= sample_rate // 40 else None
 
 
 def get_video_duration(file_path: Path) -> float:
@@ -438,10 +764,56 @@ def run() -> None:
         default=5.0,
         help="Set the maximum clip length for splitting videos (in seconds).",
     )
+    parser.add_argument(
+        "--split-strategy",
+        type=SplitStrategy,
+        choices=[str(i.value) for i in SplitStrategy],  # noqa
+        default=SplitStrategy.FFMPEG,
+        help="How videos are split into clips: cut clip files with ffmpeg, or decode clip spans straight from "
+        "source videos without writing clip files.",
+    )
     parser.add_argument(
         "--device", "-d", type=str, default="cuda", help="Device to use for model inference: 'cuda' or 'cpu'."
     )
     parser.add_argument("--batch-size", "-bs", type=int, default=32, help="Batch size for model inference.")
+    parser.add_argument(
+        "--token-merging-ratio",
+        type=float,
+        default=None,
+        help="Share of vision tokens merged after each encoder layer to speed up inference (e.g. 0.1), "
+        "check recall with evaluate_embedder first.",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=2,
+        help="Number of batches waiting between pipeline stages (splitting, preprocessing, inference, saving).",
+    )
+    parser.add_argument(
+        "--preprocess-workers",
+        type=int,
+        default=None,
+        help="Number of threads decoding and transforming media of a batch, 0 to decode in the main thread. "
+        "Compare preprocessing and model throughput printed at the end to tune it.",
+    )
+    parser.add_argument(
+        "--image-draft",
+        action="store_true",
+        help="Decode JPEG images downscaled close to the model input size, faster but changes embeddings slightly.",
+    )
+    parser.add_argument(
+        "--num-shards",
+        type=int,
+        default=1,
+        help="Split media files into this many shards, computed by separate processes and combined with "
+        "merge_embeddings.",
+    )
+    parser.add_argument("--shard-index", type=int, default=0, help="Index of the shard computed by this process.")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run with the same settings, skipping media files and clips already saved.",
+    )
 
     args = parser.parse_args()
     main(
@@ -454,6 +826,14 @@ def run() -> None:
         clip_length=args.clip_length,
         device=args.device,
         batch_size=args.batch_size,
+        token_merging_ratio=args.token_merging_ratio,
+        preprocess_workers=args.preprocess_workers,
+        image_draft=args.image_draft,
+        split_strategy=args.split_strategy,
+        queue_size=args.queue_size,
+        num_shards=args.num_shards,
+        shard_index=args.shard_index,
+        resume=args.resume,
     )
 
 
@@ -41,13 +41,16 @@ def main(
 
     print("Building Milvus collections...")
     build_storage(storage_type)
-    build_milvus_collection(
+    modality_ids = build_milvus_collection(
         index_name,
         modality_embeddings=modality_embeddings,
         embeddings_dim=embeddings_dim,  # noqa
         labels=labels,
         index_type=index_type,
     )
+    # id -> row mapping for local lookups of indexed embeddings
+    for modality, ids in modality_ids.items():
+        np.save(index_path / f"{model_type}_{modality}_ids.npy", np.array(ids, dtype=np.int64))
     print("Done!")
 
 
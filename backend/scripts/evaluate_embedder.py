@@ -0,0 +1,361 @@
+import argparse
+import ctypes
+import dataclasses
+import random
+import time
+from pathlib import Path
+from typing import Optional
+
+import torch
+from more_itertools import chunked
+from tqdm import tqdm
+
+from src.entity.embedder.base import EmbedderType, IEmbedder, Modality, Precision
+from src.entity.embedder.language_bind import LanguageBindOptions
+from src.entity.factory import build_embedder
+
+_EXTENSIONS = {
+    Modality.VIDEO: [".mp4", ".avi", ".mov", ".mkv", ".wmv", ".flv"],
+    Modality.AUDIO: [".wav", ".mp3", ".flac", ".ogg", ".m4a"],
+    Modality.IMAGE: [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff"],
+}
+
+
+def main(
+    data_path: Path,
+    modality: Modality,
+    queries_path: Optional[Path],
+    model_type: EmbedderType,
+    device: str,
+    batch_size: int,
+    sample_size: int,
+    top_k: int,
+    candidate_options: LanguageBindOptions,
+    profile_batch_sizes: Optional[list[int]] = None,
+) -> None:
+    print(
+        "####################\n"
+        f"Data Path: {data_path}\n"
+        f"Modality: {modality}\n"
+        f"Queries: {queries_path}\n"
+        f"Model: {model_type}\n"
+        f"Device: {device}\n"
+        f"Batch Size: {batch_size}\n"
+        f"Sample Size: {sample_size}\n"
+        f"Top K: {top_k}\n"
+        f"Candidate: {candidate_options}\n"
+        f"Profile Batch Sizes: {profile_batch_sizes}\n"
+        "####################"
+    )
+
+    if modality == Modality.TEXT:
+        corpus = [line.strip() for line in data_path.open() if line.strip()]
+    else:
+        corpus = [str(path) for path in sorted(data_path.rglob("*")) if path.suffix.lower() in _EXTENSIONS[modality]]
+    corpus = random.Random(0).sample(corpus, min(sample_size, len(corpus)))
+    queries = [line.strip() for line in queries_path.open() if line.strip()] if queries_path else []
+    print(f'Sampled "{len(corpus)}" {modality} items and "{len(queries)}" text queries')
+    if len(corpus) <= top_k:
+        raise ValueError(f"Sample must contain more than {top_k} items, got {len(corpus)}.")
+
+    print("Loading models...")
+    # the reference keeps fixed length text padding, as the model was trained with it, LoRA adapters unmerged,
+    # temporal attention on rearrange copies and decodes media in the main thread
+    reference = build_embedder(
+        model_type,
+        device=device,
+        options=LanguageBindOptions(
+            text_padding="max_length", merge_lora=False, strided_temporal_attention=False, preprocess_workers=0
+        ),
+    )
+    candidate = build_embedder(model_type, device=device, options=candidate_options)
+
+    results = {}
+    for name, embedder in (("reference", reference), ("candidate", candidate)):
+        corpus_embeddings, latency = _embed(embedder, corpus, modality=modality, batch_size=batch_size)
+        query_embeddings, _ = _embed(embedder, queries, modality=Modality.TEXT, batch_size=batch_size)
+        results[name] = (corpus_embeddings, query_embeddings, latency)
+
+    reference_corpus, reference_queries, reference_latency = results["reference"]
+    candidate_corpus, candidate_queries, candidate_latency = results["candidate"]
+
+    drift = 1 - torch.nn.functional.cosine_similarity(reference_corpus, candidate_corpus, dim=-1)
+    print(f"Cosine drift ({modality}): mean={drift.mean():.6f} max={drift.max():.6f}")
+    if queries:
+        drift = 1 - torch.nn.functional.cosine_similarity(reference_queries, candidate_queries, dim=-1)
+        print(f"Cosine drift (queries): mean={drift.mean():.6f} max={drift.max():.6f}")
+        recall = _recall_at_k(reference_queries, reference_corpus, candidate_queries, candidate_corpus, k=top_k)
+        print(f"Recall@{top_k} (queries -> {modality}): {recall:.4f}")
+    # neighbours of each sampled item among the other items
+    recall = _recall_at_k(reference_corpus, reference_corpus, candidate_corpus, candidate_corpus, k=top_k)
+    print(f"Recall@{top_k} ({modality} -> {modality}): {recall:.4f}")
+    print(
+        f"Latency per batch: reference={reference_latency * 1000:.1f}ms candidate={candidate_latency * 1000:.1f}ms "
+        f"speedup={reference_latency / candidate_latency:.2f}x"
+    )
+    print(
+        f"Throughput: reference={batch_size / reference_latency:.2f} items/s "
+        f"candidate={batch_size / candidate_latency:.2f} items/s"
+    )
+
+    texts = corpus if modality == Modality.TEXT else queries
+    if texts:
+        print("Single query latency by query length (words):")
+        for length, (reference_latency, candidate_latency, max_drift) in _text_latency_by_length(
+            reference, candidate, texts=texts
+        ).items():
+            print(
+                f"  {length:>6}: reference={reference_latency * 1000:.1f}ms candidate={candidate_latency * 1000:.1f}ms "
+                f"speedup={reference_latency / candidate_latency:.2f}x max_drift={max_drift:.6f}"
+            )
+
+    if profile_batch_sizes:
+        profiled = {"candidate": candidate}
+        if modality == Modality.VIDEO and candidate_options.strided_temporal_attention:
+            # the same candidate with temporal attention on rearrange copies, as before strided views
+            profiled["rearrange"] = build_embedder(
+                model_type,
+                device=device,
+                options=dataclasses.replace(candidate_options, strided_temporal_attention=False),
+            )
+        print(f"Latency and peak memory above memory in use by batch size ({modality}):")
+        for size in profile_batch_sizes:
+            for name, embedder in profiled.items():
+                latency, peak_memory = _profile(embedder, corpus, modality=modality, batch_size=size, device=device)
+                print(
+                    f"  batch_size={size} {name}: latency={latency * 1000:.1f}ms "
+                    f"per_item={latency / size * 1000:.1f}ms peak_memory={peak_memory / 2**20:.0f}MB"
+                )
+    print("Done!")
+
+
+def _embed(embedder: IEmbedder, data: list[str], modality: Modality, batch_size: int) -> tuple[torch.Tensor, float]:
+    if not data:
+        return torch.empty(0), 0.0
+
+    embeddings, timings = [], []
+    for batch in tqdm(list(chunked(data, n=batch_size)), desc=str(modality.value)):
+        start = time.perf_counter()
+        embeddings.append(embedder.embed(batch, modality=modality).detach().cpu().float())
+        timings.append(time.perf_counter() - start)
+    # the first batch includes warm up
+    timings = timings[1:] or timings
+    return torch.cat(embeddings), sum(timings) / len(timings)
+
+
+def _profile(
+    embedder: IEmbedder, data: list[str], modality: Modality, batch_size: int, device: str, repeats: int = 3
+) -> tuple[float, int]:
+    """
+    Mean latency of a batch and peak memory of embedding it above the memory in use before, so loaded models do not
+    count: allocated CUDA memory, or process RSS on CPU (Linux only).
+    """
+    batch = [data[i % len(data)] for i in range(batch_size)]
+    embedder.embed(batch, modality=modality)  # warm up
+    memory_in_use = _reset_peak_memory(device)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        embedder.embed(batch, modality=modality)
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    latency = (time.perf_counter() - start) / repeats
+    return latency, _get_peak_memory(device) - memory_in_use
+
+
+def _reset_peak_memory(device: str) -> int:
+    """Resets peak memory to the memory in use and returns it."""
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        return torch.cuda.memory_allocated()
+    # return memory freed by the warm up to the system, so it is not reused unseen
+    ctypes.CDLL("libc.so.6").malloc_trim(0)
+    # resets the peak RSS (VmHWM) of the process to its current RSS
+    Path("/proc/self/clear_refs").write_text("5")
+    return _read_process_status("VmRSS")
+
+
+def _get_peak_memory(device: str) -> int:
+    if device.startswith("cuda"):
+        return torch.cuda.max_memory_allocated()
+    return _read_process_status("VmHWM")
+
+
+def _read_process_status(field: str) -> int:
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith(f"{field}:"):
+            return int(line.split()[1]) * 1024  # kB
+    raise ValueError(f"No {field} in /proc/self/status")
+
+
+def _text_latency_by_length(
+    reference: IEmbedder, candidate: IEmbedder, texts: list[str]
+) -> dict[str, tuple[float, float, float]]:
+    """Mean single query latency of both embedders and max cosine drift, grouped by number of words."""
+    buckets = ((1, 4), (5, 8), (9, 16), (17, 32), (33, None))
+    timings: dict[str, list[tuple[float, float, float]]] = {}
+    for text in tqdm(texts, desc="queries"):
+        words = len(text.split())
+        low, high = next((low, high) for low, high in buckets if high is None or words <= high)
+        results = []
+        for embedder in (reference, candidate):
+            start = time.perf_counter()
+            embedding = embedder.embed(text, modality=Modality.TEXT).detach().cpu().float()
+            results.append((time.perf_counter() - start, embedding))
+        (reference_time, reference_embedding), (candidate_time, candidate_embedding) = results
+        drift = 1 - torch.nn.functional.cosine_similarity(reference_embedding, candidate_embedding, dim=-1).item()
+        timings.setdefault(f"{low}-{high}" if high else f"{low}+", []).append((reference_time, candidate_time, drift))
+
+    return {
+        length: (
+            sum(t[0] for t in values) / len(values),
+            sum(t[1] for t in values) / len(values),
+            max(t[2] for t in values),
+        )
+        for length, values in sorted(timings.items(), key=lambda x: int(x[0].split("-")[0].rstrip("+")))
+    }
+
+
+def _recall_at_k(
+    reference_queries: torch.Tensor,
+    reference_corpus: torch.Tensor,
+    candidate_queries: torch.Tensor,
+    candidate_corpus: torch.Tensor,
+    k: int,
+) -> float:
+    """Share of the reference top k neighbours that are also in the candidate top k."""
+
+    def top_k(queries: torch.Tensor, corpus: torch.Tensor) -> torch.Tensor:
+        scores = _normalize(queries) @ _normalize(corpus).T
+        if queries is corpus:
+            scores.fill_diagonal_(-float("inf"))
+        return scores.topk(k, dim=-1).indices
+
+    reference_top_k = top_k(reference_queries, reference_corpus)
+    candidate_top_k = top_k(candidate_queries, candidate_corpus)
+    hits = sum(len(set(r.tolist()) & set(c.tolist())) for r, c in zip(reference_top_k, candidate_top_k))
+    return hits / reference_top_k.numel()
+
+
+def _normalize(embeddings: torch.Tensor) -> torch.Tensor:
+    return torch.nn.functional.normalize(embeddings, dim=-1)
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare embeddings of an optimized embedder against the fp32 reference on a data sample."
+    )
+
+    parser.add_argument(
+        "--data-path",
+        "--path",
+        "-p",
+        type=Path,
+        required=True,
+        help="Directory with media files, or a text file with one sentence per line for 'language' modality.",
+    )
+    parser.add_argument(
+        "--modality",
+        type=Modality,
+        required=True,
+        choices=[str(m.value) for m in (Modality.VIDEO, Modality.AUDIO, Modality.IMAGE, Modality.TEXT)],  # noqa
+        help="Modality of the data sample",
+    )
+    parser.add_argument(
+        "--queries", "-q", type=Path, default=None, help="Text file with one search query per line (optional)."
+    )
+    parser.add_argument(
+        "--model",
+        "-m",
+        type=EmbedderType,
+        choices=[str(i.value) for i in EmbedderType],  # noqa
+        default=EmbedderType.LANGUAGE_BIND,
+        help="Embedder model",
+    )
+    parser.add_argument(
+        "--device", "-d", type=str, default="cpu", help="Device to use for model inference: 'cuda' or 'cpu'."
+    )
+    parser.add_argument("--batch-size", "-bs", type=int, default=8, help="Batch size for model inference.")
+    parser.add_argument("--sample-size", "-s", type=int, default=256, help="Number of sampled data items.")
+    parser.add_argument("--top-k", "-k", type=int, default=10, help="K for recall@k.")
+    parser.add_argument(
+        "--precision",
+        type=Precision,
+        choices=[str(p.value) for p in Precision],  # noqa
+        default=Precision.FP32,
+        help="Candidate inference precision",
+    )
+    parser.add_argument(
+        "--trace-cache-dir",
+        type=Path,
+        default=None,
+        help="Run candidate encoders as TorchScript graphs cached in this directory.",
+    )
+    parser.add_argument(
+        "--text-padding",
+        type=str,
+        choices=["longest", "max_length"],
+        default=None,
+        help="Candidate text padding, longest unless traced, the reference pads to 77 tokens.",
+    )
+    parser.add_argument(
+        "--no-merge-lora",
+        dest="merge_lora",
+        action="store_false",
+        help="Keep candidate LoRA adapters unmerged, as in the reference.",
+    )
+    parser.add_argument(
+        "--token-merging-ratio",
+        type=float,
+        default=None,
+        help="Share of candidate vision tokens merged after each encoder layer (e.g. 0.1).",
+    )
+    parser.add_argument(
+        "--no-strided-temporal-attention",
+        dest="strided_temporal_attention",
+        action="store_false",
+        help="Run candidate video temporal attention on rearrange copies, as in the reference.",
+    )
+    parser.add_argument(
+        "--preprocess-workers",
+        type=int,
+        default=None,
+        help="Number of candidate threads decoding and transforming media of a batch.",
+    )
+    parser.add_argument("--image-draft", action="store_true", help="Decode candidate JPEG images downscaled.")
+    parser.add_argument(
+        "--profile-batch-sizes",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Report candidate latency and peak memory for these batch sizes (e.g. 1 4 8 16), for video also "
+        "with temporal attention on rearrange copies.",
+    )
+
+    args = parser.parse_args()
+    main(
+        data_path=args.data_path,
+        modality=args.modality,
+        queries_path=args.queries,
+        model_type=args.model,
+        device=args.device,
+        batch_size=args.batch_size,
+        sample_size=args.sample_size,
+        top_k=args.top_k,
+        candidate_options=LanguageBindOptions(
+            precision=args.precision,
+            trace_cache_dir=args.trace_cache_dir,
+            text_padding=args.text_padding,
+            merge_lora=args.merge_lora,
+            token_merging_ratio=args.token_merging_ratio,
+            strided_temporal_attention=args.strided_temporal_attention,
+            preprocess_workers=args.preprocess_workers,
+            image_draft=args.image_draft,
+        ),
+        profile_batch_sizes=args.profile_batch_sizes,
+    )
+
+
+if __name__ == "__main__":
+    run()
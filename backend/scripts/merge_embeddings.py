@@ -0,0 +1,146 @@
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import yaml
+
+from scripts.compute_embeddings import get_shard_path
+from src.entity.embedder.base import EmbedderType
+
+
+def main(
+    indexes_root: Path,
+    dataset_name: str,
+    dataset_version: str,
+    model_type: EmbedderType,
+) -> None:
+    index_path = indexes_root / dataset_name / dataset_version
+    print(
+        "####################\n"
+        f"Indexes Root: {indexes_root}\n"
+        f"Dataset Name: {dataset_name}\n"
+        f"Dataset Version: {dataset_version}\n"
+        f"Model: {model_type}\n"
+        "####################"
+    )
+
+    shard_paths = get_shard_paths(index_path)
+    print(f'Merging "{len(shard_paths)}" shards from "{index_path / "shards"}"')
+    metas = [yaml.safe_load((shard_path / "meta.yaml").read_text()) for shard_path in shard_paths]
+
+    pattern = f"{model_type}_*_embeddings.npy"
+    embedding_names = sorted({file.name for shard_path in shard_paths for file in shard_path.glob(pattern)})
+    if not embedding_names:
+        raise ValueError(f"No {model_type} embeddings found in shards: {index_path / 'shards'}")
+    # shards without media files, or with errors only, have no embeddings and no labels
+    embedded_shard_paths = []
+    for shard_path in shard_paths:
+        if any((shard_path / name).exists() for name in embedding_names):
+            embedded_shard_paths.append(shard_path)
+        else:
+            print(f'Shard "{shard_path.name}" has no embeddings, skipped')
+
+    emb_shapes = {}
+    for name in embedding_names:
+        embeddings = []
+        for shard_path in embedded_shard_paths:
+            if not (shard_path / name).exists():
+                raise ValueError(f"Shard {shard_path} has no {name}, shards were computed with different modes")
+            embeddings.append(np.load(shard_path / name))
+        merged_embeddings = np.vstack(embeddings)
+        emb_shapes[name.split("_")[1]] = merged_embeddings.shape
+        np.save(index_path / name, merged_embeddings)
+
+    # shards are concatenated in the same order, so labels stay aligned with embeddings rows
+    with (index_path / "labels.jsonlines").open("w") as labels_file:
+        for shard_path in embedded_shard_paths:
+            labels = (shard_path / "labels.jsonlines").read_text()
+            rows = np.load(shard_path / embedding_names[0], mmap_mode="r").shape[0]
+            if len(labels.splitlines()) != rows:
+                raise ValueError(f"Shard {shard_path} has {len(labels.splitlines())} labels for {rows} embeddings")
+            labels_file.write(labels)
+    with (index_path / "errors.jsonlines").open("w") as errors_file:
+        for shard_path in shard_paths:
+            errors_file.write((shard_path / "errors.jsonlines").read_text())
+
+    print("Saving metadata")
+    dataset_meta: dict[str, Any] = {}
+    for meta in metas:
+        for key, value in meta["Dataset Meta"].items():
+            if isinstance(value, int):
+                dataset_meta[key] = dataset_meta.get(key, 0) + value
+    dataset_meta["Embeddings Shape"] = f"{emb_shapes}"
+    run_configuration = dict(metas[0]["Script Run Configuration"])
+    run_configuration.pop("Shard Index")
+    run_configuration["Date"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with (index_path / "meta.yaml").open("w") as file:
+        yaml.dump(
+            {
+                "Dataset": metas[0]["Dataset"],
+                "Dataset Meta": dataset_meta,
+                "Script Run Configuration": run_configuration,
+            },
+            file,
+            sort_keys=False,
+            indent=4,
+        )
+    print((index_path / "meta.yaml").read_text())
+    print("Done!")
+
+
+def get_shard_paths(index_path: Path) -> list[Path]:
+    """Paths of all shards of an index in shard order. Shards are complete once their metadata is saved."""
+    shard_paths = sorted((index_path / "shards").glob("*-of-*"))
+    if not shard_paths:
+        raise ValueError(f"No shards found in directory: {index_path / 'shards'}")
+
+    num_shards = int(shard_paths[0].name.split("-of-")[1])
+    expected_paths = [get_shard_path(index_path, shard_index=i, num_shards=num_shards) for i in range(num_shards)]
+    if shard_paths != expected_paths:
+        raise ValueError(
+            f"Shards {[p.name for p in shard_paths]} do not match {num_shards} shards, "
+            "remove shards of previous runs with a different number of shards."
+        )
+    incomplete = [p.name for p in shard_paths if not (p / "meta.yaml").exists()]
+    if incomplete:
+        raise ValueError(f"Shards {incomplete} are not computed yet.")
+    return shard_paths
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description="Merge embeddings computed in shards into a dataset version index.")
+
+    parser.add_argument(
+        "--dataset-name", "--name", "-n", type=str, required=True, help="Name of the dataset (e.g., 'MyDataset')."
+    )
+    parser.add_argument(
+        "--dataset-version",
+        "--version",
+        "-v",
+        type=str,
+        required=True,
+        help="Version of the dataset (e.g., 'v1.0', '5s').",
+    )
+    parser.add_argument(
+        "--model",
+        "-m",
+        type=EmbedderType,
+        required=True,
+        choices=[str(i.value) for i in EmbedderType],  # noqa
+        default=EmbedderType.LANGUAGE_BIND,
+        help="Embedder model",
+    )
+
+    args = parser.parse_args()
+    main(
+        indexes_root=Path("../indexes"),
+        dataset_name=args.dataset_name,
+        dataset_version=args.dataset_version,
+        model_type=args.model,
+    )
+
+
+if __name__ == "__main__":
+    run()
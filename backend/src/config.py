@@ -1,10 +1,10 @@
 import json
 import os
-from typing import TypedDict
+from typing import Optional, TypedDict
 
 import yaml
 
-from src.entity.embedder.base import EmbedderType, Modality
+from src.entity.embedder.base import EmbedderType, Modality, Precision
 from src.entity.storage.base import StorageType
 
 
@@ -18,6 +18,23 @@ class _DatasetConfig(TypedDict):
 class Config:
     EMBEDDER_TYPE: EmbedderType
     DEVICE: str
+    EMBEDDER_PRECISION: Precision
+    EMBEDDER_TRACE_CACHE_DIR: Optional[str]
+    EMBEDDER_LAZY_LOADING: bool
+    EMBEDDER_PRELOAD: Optional[list[Modality]]
+    EMBEDDER_MEMORY_BUDGET_MB: Optional[int]
+    EMBEDDER_BATCH_WINDOW_MS: float
+    EMBEDDER_MAX_BATCH_SIZE: int
+    EMBEDDING_CACHE_SIZE: int
+    EMBEDDING_CACHE_TTL: Optional[float]
+    EMBEDDING_CACHE_DIR: Optional[str]
+    EMBEDDING_CACHE_DISK_SIZE: Optional[int]
+    INFERENCE_WORKERS: int
+    INFERENCE_QUEUE_SIZE: int
+    IO_WORKERS: int
+    IO_QUEUE_SIZE: int
+    MAX_UPLOAD_SIZE_MB: int
+    UPLOAD_MEMORY_SIZE_MB: int
     STORAGE_TYPE: StorageType
     MILVUS_URL: str
     MILVUS_DB_NAME: str
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Union
+from typing import Any, BinaryIO, Union
 
 import torch
 
@@ -23,7 +23,35 @@ class EmbedderType(str, Enum):
     RANDOM = "Random"
 
 
+class Precision(str, Enum):
+    FP32 = "fp32"
+    BF16 = "bf16"  # autocast, weights are kept in fp32
+    INT8 = "int8"  # dynamic quantization of Linear layers, CPU only
+
+
+# (path, start_sec, end_sec) of a video clip
+VideoSpan = tuple[str, float, float]
+# (waveform of shape (channels, samples), sample_rate) of decoded audio
+AudioWaveform = tuple[torch.Tensor, int]
+MediaBatch = Union[list[str], list[VideoSpan], list[AudioWaveform]]
+EmbedderInput = Union[str, BinaryIO, MediaBatch, torch.Tensor]
+
+
 class IEmbedder(ABC):
     @abstractmethod
-    def embed(self, data: Union[str, list[str], torch.Tensor], modality: Modality) -> torch.Tensor:
-        pass
+    def embed(self, data: EmbedderInput, modality: Modality) -> torch.Tensor:
+        """
+        Embeds a text, a media file path or file-like object, a list of them, or preprocessed inputs.
+        Video clips can be given as spans of source videos and audio as decoded waveforms.
+        """
+
+    @abstractmethod
+    def preprocess(self, data: MediaBatch, modality: Modality) -> torch.Tensor:
+        """
+        Decodes and transforms a batch of media into the model inputs tensor to be passed to `embed` later,
+        so preprocessing of the next batch can overlap with inference.
+        """
+
+    def get_options(self) -> dict[str, Any]:
+        """Options embeddings depend on besides the model type, e.g. to keep cached embeddings of other ones apart."""
+        return {}
@@ -0,0 +1,113 @@
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Iterable
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any
+
+import torch
+
+from src.entity.embedder.base import EmbedderInput, IEmbedder, MediaBatch, Modality
+from src.utils.metrics import IMetricsProvider
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _PendingRequest:
+    data: str
+    modality: Modality
+    future: Future = field(default_factory=Future)
+
+
+class BatchingEmbedder(IEmbedder, IMetricsProvider):
+    """
+    Collects concurrent single-item requests for up to `window_ms` (or until `max_batch_size` requests are queued)
+    and embeds them with one batched forward pass. Batched inputs are passed to the wrapped embedder as is.
+    """
+
+    def __init__(
+        self,
+        embedder: IEmbedder,
+        window_ms: float = 5,
+        max_batch_size: int = 16,
+        modalities: Iterable[Modality] = (Modality.TEXT,),
+    ):
+        self._embedder = embedder
+        self._window = window_ms / 1000
+        self._max_batch_size = max_batch_size
+        self._modalities = set(modalities)
+        self._queue: queue.Queue[_PendingRequest] = queue.Queue()
+
+        self._lock = threading.Lock()
+        self._batches_count = 0
+        self._requests_count = 0
+        self._last_batch_size = 0
+
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def embed(self, data: EmbedderInput, modality: Modality) -> torch.Tensor:
+        if not isinstance(data, str) or modality not in self._modalities:
+            return self._embedder.embed(data, modality=modality)
+
+        request = _PendingRequest(data=data, modality=modality)
+        self._queue.put(request)
+        return request.future.result()
+
+    def preprocess(self, data: MediaBatch, modality: Modality) -> torch.Tensor:
+        return self._embedder.preprocess(data, modality=modality)
+
+    def get_options(self) -> dict[str, Any]:
+        return self._embedder.get_options()
+
+    def get_metrics(self) -> dict[str, float]:
+        with self._lock:
+            batches_count, requests_count = self._batches_count, self._requests_count
+            last_batch_size = self._last_batch_size
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches_total": batches_count,
+            "requests_total": requests_count,
+            "last_batch_size": last_batch_size,
+            "avg_batch_size": requests_count / batches_count if batches_count else 0.0,
+            "avg_batch_fill": requests_count / (batches_count * self._max_batch_size) if batches_count else 0.0,
+        }
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._window
+            while len(batch) < self._max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch: list[_PendingRequest]) -> None:
+        with self._lock:
+            self._batches_count += 1
+            self._requests_count += len(batch)
+            self._last_batch_size = len(batch)
+
+        requests_by_modality: dict[Modality, list[_PendingRequest]] = defaultdict(list)
+        for request in batch:
+            requests_by_modality[request.modality].append(request)
+
+        for modality, requests in requests_by_modality.items():
+            try:
+                embeddings = self._embedder.embed([request.data for request in requests], modality=modality)
+            except Exception as e:
+                logger.warning("Failed to embed batch of %d %s requests: %s", len(requests), modality, e)
+                for request in requests:
+                    request.future.set_exception(e)
+                continue
+            for request, embedding in zip(requests, embeddings):
+                request.future.set_result(embedding)
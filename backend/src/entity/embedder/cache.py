@@ -0,0 +1,197 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Optional, Union
+
+import numpy as np
+import torch
+from cachetools import Cache, LRUCache, TTLCache
+
+from src.entity.embedder.base import EmbedderInput, IEmbedder, MediaBatch, Modality
+from src.utils.metrics import IMetricsProvider
+
+
+class CachingEmbedder(IEmbedder, IMetricsProvider):
+    """
+    Caches embeddings by normalized text or file content hash, modality and `namespace` (the embedding model).
+    Inputs with a precomputed `sha256` attribute (e.g. spooled uploads) are keyed by it without reading them again.
+    Entries are evicted by LRU and `ttl` (seconds), and optionally persisted to `cache_dir` to survive restarts,
+    keeping up to about `disk_maxsize` of the newest entries there.
+    """
+
+    _HASH_CHUNK_SIZE = 2**20
+
+    def __init__(
+        self,
+        embedder: IEmbedder,
+        namespace: str,
+        maxsize: int = 4096,
+        ttl: Optional[float] = None,
+        cache_dir: Optional[Path] = None,
+        disk_maxsize: Optional[int] = None,
+    ):
+        self._embedder = embedder
+        self._namespace = namespace
+        self._memory: Cache = TTLCache(maxsize=maxsize, ttl=ttl) if ttl else LRUCache(maxsize=maxsize)
+        self._disk = _DiskCache(cache_dir / "embeddings.sqlite", ttl=ttl, maxsize=disk_maxsize) if cache_dir else None
+
+        self._lock = threading.Lock()
+        self._stats = {kind: {"hits": 0, "disk_hits": 0, "misses": 0} for kind in ("text", "file")}
+
+    def embed(self, data: EmbedderInput, modality: Modality) -> torch.Tensor:
+        items = _get_cacheable_items(data)
+        if items is None:
+            return self._embedder.embed(data, modality=modality)
+
+        if not isinstance(data, list):
+            key = self._make_key(items[0], modality)
+            embedding = self._get(key, kind=_kind(modality))
+            if embedding is None:
+                embedding = self._put(key, self._embedder.embed(data, modality=modality))
+            return embedding
+
+        keys = [self._make_key(item, modality) for item in items]
+        embeddings = [self._get(key, kind=_kind(modality)) for key in keys]
+        missing_indexes = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing_indexes:
+            missing_embeddings = self._embedder.embed([data[i] for i in missing_indexes], modality=modality)
+            for i, embedding in zip(missing_indexes, missing_embeddings):
+                embeddings[i] = self._put(keys[i], embedding)
+        return torch.stack(embeddings)  # type: ignore[arg-type]
+
+    def preprocess(self, data: MediaBatch, modality: Modality) -> torch.Tensor:
+        return self._embedder.preprocess(data, modality=modality)
+
+    def get_options(self) -> dict[str, Any]:
+        return self._embedder.get_options()
+
+    def get_metrics(self) -> dict[str, float]:
+        with self._lock:
+            stats = {kind: dict(counters) for kind, counters in self._stats.items()}
+            size = len(self._memory)
+        stats["all"] = {name: sum(counters[name] for counters in stats.values()) for name in stats["text"]}
+
+        metrics: dict[str, float] = {"size": size}
+        for kind, counters in stats.items():
+            prefix = "" if kind == "all" else f"{kind}_"
+            requests = sum(counters.values())
+            metrics[f"{prefix}hits_total"] = counters["hits"]
+            metrics[f"{prefix}disk_hits_total"] = counters["disk_hits"]
+            metrics[f"{prefix}misses_total"] = counters["misses"]
+            metrics[f"{prefix}hit_rate"] = (counters["hits"] + counters["disk_hits"]) / requests if requests else 0.0
+        return metrics
+
+    def _get(self, key: str, kind: str) -> Optional[torch.Tensor]:
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._stats[kind]["hits"] += 1
+                return embedding
+
+        embedding = self._disk.get(key) if self._disk else None
+        with self._lock:
+            if embedding is None:
+                self._stats[kind]["misses"] += 1
+                return None
+            self._stats[kind]["disk_hits"] += 1
+            self._memory[key] = embedding
+        return embedding
+
+    def _put(self, key: str, embedding: torch.Tensor) -> torch.Tensor:
+        embedding = embedding.detach().cpu().clone()
+        with self._lock:
+            self._memory[key] = embedding
+        if self._disk:
+            self._disk.put(key, embedding)
+        return embedding
+
+    def _make_key(self, data: Union[str, BinaryIO], modality: Modality) -> str:
+        if modality == Modality.TEXT:
+            # the tokenizer lowercases and collapses whitespaces anyway
+            digest = hashlib.sha256(" ".join(data.split()).lower().encode()).hexdigest()  # type: ignore[union-attr]
+        elif hasattr(data, "sha256"):
+            digest = data.sha256  # type: ignore[union-attr]
+        else:
+            digest = _hash_file(data, chunk_size=self._HASH_CHUNK_SIZE)  # type: ignore[arg-type]
+        return f"{self._namespace}/{modality.value}/{digest}"
+
+
+class _DiskCache:
+    # expired and oldest entries above `maxsize` are deleted at start and after this many inserts
+    _PURGE_INTERVAL = 1024
+
+    def __init__(self, path: Path, ttl: Optional[float] = None, maxsize: Optional[int] = None):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._inserts = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, created_at REAL, embedding BLOB)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_created_at ON embeddings (created_at)")
+            self._purge()
+
+    def get(self, key: str) -> Optional[torch.Tensor]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT created_at, embedding FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        created_at, blob = row
+        if self._ttl and created_at < time.time() - self._ttl:
+            return None
+        return torch.from_numpy(np.frombuffer(blob, dtype=np.float32).copy())
+
+    def put(self, key: str, embedding: torch.Tensor) -> None:
+        blob = embedding.numpy().astype(np.float32).tobytes()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO embeddings (key, created_at, embedding) VALUES (?, ?, ?)",
+                (key, time.time(), blob),
+            )
+            self._inserts += 1
+            if self._inserts % self._PURGE_INTERVAL == 0:
+                self._purge()
+
+    def _purge(self) -> None:
+        if self._ttl:
+            self._connection.execute("DELETE FROM embeddings WHERE created_at < ?", (time.time() - self._ttl,))
+        if self._maxsize is not None:
+            self._connection.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self._maxsize,),
+            )
+
+
+def _get_cacheable_items(data: EmbedderInput) -> Optional[list[Union[str, BinaryIO]]]:
+    """
+    Texts, file paths and file-like objects with a content hash to build keys of, or None if `data` is not cached:
+    preprocessed inputs, file-like objects without content hash, video spans and audio waveforms.
+    """
+    if isinstance(data, torch.Tensor):
+        return None
+    items: list[Union[str, BinaryIO]] = []
+    for item in data if isinstance(data, list) else [data]:
+        if not (isinstance(item, str) or (not isinstance(item, tuple) and hasattr(item, "sha256"))):
+            return None
+        items.append(item)
+    return items
+
+
+def _kind(modality: Modality) -> str:
+    return "text" if modality == Modality.TEXT else "file"
+
+
+def _hash_file(path: str, chunk_size: int) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
@@ -1,51 +1,183 @@
-from typing import Any, Optional, Union
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO, Optional, Union
 
 import torch
 from languagebind import LanguageBind, to_device, transform_dict
 from languagebind.image.tokenization_image import LanguageBindImageTokenizer
+from torch import nn
 
-from src.entity.embedder.base import IEmbedder, Modality
+from src.entity.embedder.base import EmbedderInput, IEmbedder, MediaBatch, Modality, Precision
+from src.utils.metrics import IMetricsProvider
 
 
-class LanguageBindEmbedder(IEmbedder):
+@dataclass(frozen=True)
+class LanguageBindOptions:
+    """
+    Model loading and runtime options of `LanguageBindEmbedder`, see `languagebind.LanguageBind` for model ones.
+    `text_padding` is "longest" unless encoders are traced. Media of a batch are decoded by `preprocess_workers`
+    threads, `image_draft` decodes JPEG images downscaled.
+    """
+
+    lazy: bool = False
+    preload: Optional[tuple[Modality, ...]] = None
+    memory_budget_mb: Optional[int] = None
+    precision: Precision = Precision.FP32
+    trace_cache_dir: Optional[Path] = None
+    text_padding: Optional[str] = None
+    merge_lora: bool = True
+    token_merging_ratio: Optional[float] = None
+    strided_temporal_attention: bool = True
+    preprocess_workers: Optional[int] = None
+    image_draft: bool = False
+
+
+class LanguageBindEmbedder(IEmbedder, IMetricsProvider):
+    """
+    Metrics compare preprocessing and model throughput per modality to tune the number of preprocess workers:
+    more workers help while preprocessing is the slower one.
+    """
+
     def __init__(
         self,
         models: Optional[dict[Modality, str]] = None,
         tokenizer_path: str = "LanguageBind/LanguageBind_Image",
         device: str = "cpu",
+        options: Optional[LanguageBindOptions] = None,
     ):
+        options = options or LanguageBindOptions()
         self._device = torch.device(device)
+        self._precision = Precision(options.precision)
+        trace_cache_dir = options.trace_cache_dir
+        if self._precision == Precision.INT8 and self._device.type != "cpu":
+            raise ValueError(f"Precision '{self._precision}' is supported only on cpu, got device '{device}'.")
+        if self._precision == Precision.BF16 and trace_cache_dir is not None:
+            raise ValueError(f"Precision '{self._precision}' is not supported for traced encoders.")
+        text_padding = options.text_padding
+        if text_padding is None:
+            text_padding = "longest" if trace_cache_dir is None else "max_length"
+        elif text_padding == "longest" and trace_cache_dir is not None:
+            # every query length would be traced as a new graph, and eager after `max_signatures` of them
+            raise ValueError(f"Text padding '{text_padding}' is not supported for traced encoders.")
+
         clip_type = models or {
             Modality.VIDEO: "LanguageBind_Video",
             Modality.AUDIO: "LanguageBind_Audio",
             Modality.IMAGE: "LanguageBind_Image",
         }
-        self._model = LanguageBind(clip_type=clip_type)
+        self._model = LanguageBind(
+            clip_type=clip_type,
+            lazy=options.lazy,
+            preload=list(options.preload) if options.preload else None,
+            memory_budget_mb=options.memory_budget_mb,
+            tower_transform=_quantize if self._precision == Precision.INT8 else None,
+            trace_cache_dir=str(trace_cache_dir) if trace_cache_dir else None,
+            merge_lora=options.merge_lora,
+            token_merging_ratio=options.token_merging_ratio,
+            strided_temporal_attention=options.strided_temporal_attention,
+        )
         self._model.to(device)
         self._model.eval()
         self._tokenizer = LanguageBindImageTokenizer.from_pretrained(
             tokenizer_path,
         )
-        self._modality_transform = {c: transform_dict[c](self._model.modality_config[c]) for c in clip_type}
+        processor_kwargs: dict[str, dict[str, Any]] = {
+            Modality.IMAGE: {"num_workers": options.preprocess_workers, "draft": options.image_draft},
+            Modality.VIDEO: {"num_workers": options.preprocess_workers},
+            # fixed audio chunks, so embeddings are reproducible and can be cached
+            Modality.AUDIO: {"deterministic": True},
+        }
+        self._modality_transform = {
+            c: transform_dict[c](self._model.modality_config[c], **processor_kwargs.get(c, {})) for c in clip_type
+        }
+        # padding to the longest query is enough: the causal mask hides padding from the end-of-text token,
+        # traced encoders pad to 77 tokens for a fixed input shape
         self._modality_transform[Modality.TEXT] = lambda text: self._tokenizer(
-            text, max_length=77, padding="max_length", truncation=True, return_tensors="pt"
+            text, max_length=77, padding=text_padding, truncation=True, return_tensors="pt"
         )
 
-    def embed(self, data: Union[str, list[str], torch.Tensor], modality: Modality) -> torch.Tensor:
-        inputs = {modality: data}
-        if not isinstance(data, torch.Tensor):
-            inputs = self._preprocess_inputs(inputs)  # type: ignore[assignment]
+        self._options = {
+            "models": {str(modality.value): model for modality, model in clip_type.items()},
+            "precision": str(self._precision.value),
+            "traced": trace_cache_dir is not None,
+            "text_padding": text_padding,
+            "merge_lora": options.merge_lora,
+            "token_merging_ratio": options.token_merging_ratio,
+            "image_draft": options.image_draft,
+        }
+
+        self._lock = threading.Lock()
+        # modality -> [preprocessed items, preprocess seconds, embedded items, model seconds]
+        self._stats: defaultdict[Modality, list[float]] = defaultdict(lambda: [0, 0.0, 0, 0.0])
+
+    def embed(self, data: EmbedderInput, modality: Modality) -> torch.Tensor:
+        if isinstance(data, torch.Tensor):
+            if modality == Modality.TEXT:
+                raise ValueError(f"Preprocessed inputs are not supported for '{modality}' modality.")
+            inputs = {"pixel_values": data}
+        else:
+            inputs = self._preprocess(data, modality)
+        started = time.perf_counter()
 
-        with torch.no_grad():
-            outputs = self._model(inputs)
+        autocast = (
+            torch.autocast(device_type=self._device.type, dtype=torch.bfloat16)
+            if self._precision == Precision.BF16
+            else nullcontext()
+        )
+        with torch.no_grad(), autocast:
+            outputs = self._model({modality: to_device(inputs, self._device)})
 
-        embeddings = outputs[modality]
-        if isinstance(data, str):
+        embeddings = outputs[modality].float()
+        if self._device.type == "cuda":
+            torch.cuda.synchronize(self._device)
+        with self._lock:
+            stats = self._stats[modality]
+            stats[2] += len(data) if isinstance(data, (list, torch.Tensor)) else 1
+            stats[3] += time.perf_counter() - started
+
+        if not isinstance(data, (list, torch.Tensor)):
             # for single input data return embeddings without batch_size dim
             return embeddings[0]
         return embeddings
 
-    def _preprocess_inputs(self, inputs: dict[Modality, Any]) -> dict[Modality, torch.Tensor]:
-        for modality, data in inputs.items():
-            inputs[modality] = to_device(self._modality_transform[modality](data), self._device)
+    def preprocess(self, data: MediaBatch, modality: Modality) -> torch.Tensor:
+        if modality == Modality.TEXT:
+            raise ValueError(f"Preprocessed inputs are not supported for '{modality}' modality.")
+        return self._preprocess(data, modality)["pixel_values"]
+
+    def get_options(self) -> dict[str, Any]:
+        return dict(self._options)
+
+    def get_metrics(self) -> dict[str, float]:
+        metrics: dict[str, float] = {}
+        with self._lock:
+            stats = {modality: list(s) for modality, s in self._stats.items()}
+        for modality, (preprocessed_items, preprocess_seconds, items, model_seconds) in stats.items():
+            metrics[f"{modality}_items_total"] = items
+            metrics[f"{modality}_preprocess_items_per_second"] = (
+                preprocessed_items / preprocess_seconds if preprocess_seconds else 0.0
+            )
+            metrics[f"{modality}_model_items_per_second"] = items / model_seconds if model_seconds else 0.0
+            loader = getattr(self._modality_transform[modality], "loader", None)
+            if loader is not None:
+                metrics[f"{modality}_preprocess_worker_utilization"] = loader.get_stats()["worker_utilization"]
+        return metrics
+
+    def _preprocess(self, data: Union[str, BinaryIO, MediaBatch], modality: Modality) -> dict[str, torch.Tensor]:
+        started = time.perf_counter()
+        inputs = self._modality_transform[modality](data)
+        with self._lock:
+            stats = self._stats[modality]
+            stats[0] += len(data) if isinstance(data, list) else 1
+            stats[1] += time.perf_counter() - started
         return inputs
+
+
+def _quantize(_: str, module: nn.Module) -> nn.Module:
+    # quantize_dynamic swaps only child modules, so bare Linear projections are quantized inside a container
+    container = nn.Sequential(module)
+    return torch.ao.quantization.quantize_dynamic(container, {nn.Linear}, dtype=torch.qint8)[0]
@@ -1,16 +1,17 @@
-from typing import Union
-
 import torch
 
-from src.entity.embedder.base import IEmbedder, Modality
+from src.entity.embedder.base import EmbedderInput, IEmbedder, MediaBatch, Modality
 
 
 class RandomEmbedder(IEmbedder):
     def __init__(self, embeddings_dim: int = 768):
         self._embeddings_dim = embeddings_dim
 
-    def embed(self, data: Union[str, list[str], torch.Tensor], modality: Modality) -> torch.Tensor:  # noqa
-        if isinstance(data, str):
+    def embed(self, data: EmbedderInput, modality: Modality) -> torch.Tensor:  # noqa
+        if not isinstance(data, (list, torch.Tensor)):
             # for single input data return embeddings without batch_size dim
             return torch.rand(self._embeddings_dim)
         return torch.rand(len(data), self._embeddings_dim)
+
+    def preprocess(self, data: MediaBatch, modality: Modality) -> torch.Tensor:  # noqa
+        return torch.empty(len(data), 0)
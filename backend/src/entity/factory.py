@@ -1,11 +1,12 @@
 import logging
 from functools import cache
+from typing import Optional
 
 from pymilvus import MilvusClient
 
 from src.config import Config
 from src.entity.embedder.base import EmbedderType, IEmbedder, Modality
-from src.entity.embedder.language_bind import LanguageBindEmbedder
+from src.entity.embedder.language_bind import LanguageBindEmbedder, LanguageBindOptions
 from src.entity.embedder.random import RandomEmbedder
 from src.entity.retriever.milvus import MilvusRetriever
 from src.entity.searcher.base import ISearcher
@@ -18,10 +19,12 @@ logger = logging.getLogger(__name__)
 
 
 @cache
-def build_embedder(embedder_type: EmbedderType, device: str) -> IEmbedder:
-    logger.info("Initializing %s embedder on device %s...", embedder_type, device)
+def build_embedder(
+    embedder_type: EmbedderType, device: str, options: Optional[LanguageBindOptions] = None
+) -> IEmbedder:
+    logger.info("Initializing %s embedder on device %s with %s...", embedder_type, device, options)
     if embedder_type == EmbedderType.LANGUAGE_BIND:
-        return LanguageBindEmbedder(device=device)
+        return LanguageBindEmbedder(device=device, options=options)
     if embedder_type == EmbedderType.RANDOM:
         return RandomEmbedder()
     raise NotImplementedError(f"Embedder type '{embedder_type}' is not implemented.")
@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from src.entity.embedder.base import EmbedderType, Modality
+from src.entity.storage.base import IStorage
+from src.types import CollectionEntity, IndexedEntity, Label
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class _LocalIndex:
+    rows: dict[int, tuple[Modality, int]]
+    embeddings: dict[Modality, np.ndarray]
+    labels: list[Label]
+
+
+class MemmapStorage(IStorage):
+    """
+    Looks up entities in the embeddings files saved next to the index instead of querying `storage`.
+    Embeddings are memory-mapped and found by the id -> row mapping saved by `create_index`.
+    Collections indexed without the mapping, with embeddings or labels newer than it, and unknown ids fall back to
+    `storage`.
+    """
+
+    def __init__(self, storage: IStorage, indexes_root: Path, model_type: EmbedderType):
+        self._storage = storage
+        self._indexes_root = indexes_root
+        self._model_type = model_type
+        # (dataset, version) -> ((ids mtime, embeddings and labels mtime), index)
+        self._indexes: dict[tuple[str, str], tuple[tuple[float, float], Optional[_LocalIndex]]] = {}
+        self._lock = threading.Lock()
+
+    def get_by_id(self, id: str, dataset: str, version: str) -> IndexedEntity:
+        index = self._get_index(dataset=dataset, version=version)
+        row = index.rows.get(int(id)) if index and id.isdigit() else None
+        if index is None or row is None:
+            return self._storage.get_by_id(id=id, dataset=dataset, version=version)
+
+        modality, i = row
+        if modality == Modality.HYBRID:
+            # hybrid embeddings are not saved, they are the mean of other modalities
+            embedding = np.mean([e[i] for m, e in index.embeddings.items() if m != Modality.HYBRID], axis=0)
+        else:
+            embedding = index.embeddings[modality][i]
+        label = index.labels[i]
+        span = label.get("span") or (0, 0)
+        return IndexedEntity(
+            id=int(id),
+            path=label["path"],
+            span=(span[0], span[1]),
+            modality=modality,
+            embedding=embedding.astype(np.float32).tolist(),
+        )
+
+    def get_collections(self) -> list[CollectionEntity]:
+        return self._storage.get_collections()
+
+    def _get_index(self, dataset: str, version: str) -> Optional[_LocalIndex]:
+        index_path = self._indexes_root / dataset / version
+        try:
+            ids_mtimes = [os.path.getmtime(p) for p in index_path.glob(f"{self._model_type}_*_ids.npy")]
+            data_paths = index_path.glob(f"{self._model_type}_*_embeddings.npy")
+            data_mtimes = [os.path.getmtime(p) for p in (index_path / "labels.jsonlines", *data_paths)]
+        except OSError:
+            return None
+        mtime = (max(ids_mtimes, default=0.0), max(data_mtimes))
+
+        with self._lock:
+            loaded_mtime, index = self._indexes.get((dataset, version), (None, None))
+            # reload when embeddings are recomputed or the index is rebuilt
+            if loaded_mtime != mtime:
+                if ids_mtimes and min(ids_mtimes) < max(data_mtimes):
+                    # rows of ids files would not match the embeddings and labels until create_index is run again
+                    logger.warning(
+                        "Embeddings in %s are newer than the index, entities are fetched from storage", index_path
+                    )
+                    index = None
+                else:
+                    index = self._load_index(index_path)
+                self._indexes[(dataset, version)] = (mtime, index)
+        return index
+
+    def _load_index(self, index_path: Path) -> Optional[_LocalIndex]:
+        rows: dict[int, tuple[Modality, int]] = {}
+        embeddings: dict[Modality, np.ndarray] = {}
+        for ids_path in index_path.glob(f"{self._model_type}_*_ids.npy"):
+            modality = Modality(ids_path.stem.split("_")[1])
+            ids = np.load(ids_path)
+            rows.update((int(row_id), (modality, i)) for i, row_id in enumerate(ids))
+            if modality != Modality.HYBRID:
+                embeddings[modality] = np.load(
+                    index_path / f"{self._model_type}_{modality}_embeddings.npy", mmap_mode="r"
+                )
+        if not rows:
+            logger.info("No ids files in %s, entities are fetched from storage", index_path)
+            return None
+
+        with (index_path / "labels.jsonlines").open() as f:
+            labels = [json.loads(line) for line in f]
+        logger.info("Loaded local index %s with %d entities", index_path, len(rows))
+        return _LocalIndex(rows=rows, embeddings=embeddings, labels=labels)
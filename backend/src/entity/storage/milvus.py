@@ -52,7 +52,8 @@ def build_milvus_collection(
     embeddings_dim: int,
     labels: list[Label],
     index_type: str = "FLAT",
-) -> None:
+) -> dict[Modality, list[int]]:
+    """Creates the collection and returns the generated ids of inserted entities in the order of embeddings."""
     fields = [
         FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
         FieldSchema(name="path", dtype=DataType.VARCHAR, max_length=4096),
@@ -71,6 +72,7 @@ def build_milvus_collection(
     collection.create_index("embedding", index_params)
 
     collection.load()
+    modality_ids: dict[Modality, list[int]] = {}
     for modality, embeddings in modality_embeddings.items():
         collection.create_partition(partition_name=modality)
         entities = (
@@ -83,5 +85,8 @@ def build_milvus_collection(
             }
             for embedding, label in zip(embeddings, labels)
         )
+        modality_ids[modality] = []
         for batch in chunked(entities, 10_000):  # setting limit fix gRPC resource exhausted error
-            collection.insert(batch, partition_name=modality)
+            result = collection.insert(batch, partition_name=modality)
+            modality_ids[modality] += result.primary_keys
+    return modality_ids
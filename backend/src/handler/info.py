@@ -6,6 +6,7 @@ from src.entity.embedder.base import Modality
 from src.entity.storage.base import IStorage
 from src.types import Collection
 from src.utils.docstring import DocstringMixin
+from src.utils.executor import BoundedExecutor
 
 
 class IndexInfo(BaseModel):
@@ -28,12 +29,13 @@ class IInfoHandler(ABC, DocstringMixin):
 
 
 class InfoHandler(IInfoHandler):
-    def __init__(self, storage: IStorage, available_collections: list[Collection]):
+    def __init__(self, storage: IStorage, available_collections: list[Collection], io_executor: BoundedExecutor):
         self._storage = storage
         self._available_collections = available_collections
+        self._io_executor = io_executor
 
     async def get_indexes_info(self) -> IndexesInfoResponse:
-        collections = self._storage.get_collections()
+        collections = await self._io_executor.run(self._storage.get_collections)
         infos = []
         modalities_order = Modality.get_order()
         for collection in collections:
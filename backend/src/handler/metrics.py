@@ -0,0 +1,22 @@
+from abc import ABC, abstractmethod
+
+from pydantic import RootModel
+
+from src.utils.docstring import DocstringMixin
+from src.utils.metrics import IMetricsProvider
+
+MetricsResponse = RootModel[dict[str, dict[str, float]]]
+
+
+class IMetricsHandler(ABC, DocstringMixin):
+    @abstractmethod
+    async def get_metrics(self) -> MetricsResponse:
+        """Retrieves runtime metrics of the backend components, grouped by component name."""
+
+
+class MetricsHandler(IMetricsHandler):
+    def __init__(self, providers: dict[str, IMetricsProvider]):
+        self._providers = providers
+
+    async def get_metrics(self) -> MetricsResponse:
+        return MetricsResponse({name: provider.get_metrics() for name, provider in self._providers.items()})
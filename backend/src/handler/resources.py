@@ -16,6 +16,7 @@ from starlette.responses import FileResponse, Response, StreamingResponse
 from src.config import Config
 from src.types import Collection
 from src.utils.docstring import DocstringMixin
+from src.utils.executor import BoundedExecutor
 from src.utils.streaming import build_streaming_response
 
 logger = logging.getLogger(__name__)
@@ -40,9 +41,12 @@ class IResourcesHandler(ABC, DocstringMixin):
 
 
 class ResourcesHandler(IResourcesHandler):
-    def __init__(self, dataset_paths: dict[Collection, str], indexes_path: pathlib.Path) -> None:
+    def __init__(
+        self, dataset_paths: dict[Collection, str], indexes_path: pathlib.Path, io_executor: BoundedExecutor
+    ) -> None:
         self._dataset_paths = dataset_paths
         self._indexes_path = indexes_path
+        self._io_executor = io_executor
 
     async def get_raw(
         self,
@@ -52,10 +56,10 @@ class ResourcesHandler(IResourcesHandler):
         file_path: str = Path(..., description="The file's path within the dataset"),
     ) -> Response:
         content_type = "video/mp4"
-        full_path = self._get_full_path(file_path, dataset, version)
+        full_path = await self._io_executor.run(self._get_full_path, file_path, dataset, version)
 
         if full_path.endswith(".mp4"):  # TODO: Just mp4? maybe other formats also work?
-            file_size = os.stat(full_path).st_size
+            file_size = await self._io_executor.run(os.path.getsize, full_path)
             return build_streaming_response(
                 request,
                 stream=open(full_path, "rb"),  # noqa: SIM115
@@ -64,12 +68,13 @@ class ResourcesHandler(IResourcesHandler):
             )
 
         tmp_mp4_path = f"{Config.TMP_DIR}/{hash(('raw', full_path))}.mp4"
-        if os.path.exists(tmp_mp4_path):
-            file_size = os.stat(tmp_mp4_path).st_size
+        # the mp4 converted by a previous request, if it is still there
+        converted_size = await self._io_executor.run(_get_file_size, tmp_mp4_path)
+        if converted_size is not None:
             return build_streaming_response(
                 request,
                 stream=open(tmp_mp4_path, "rb"),  # noqa: SIM115
-                file_size=file_size,
+                file_size=converted_size,
                 content_type=content_type,
             )
 
@@ -93,7 +98,7 @@ class ResourcesHandler(IResourcesHandler):
                 if process.returncode != 0:
                     raise HTTPException(status_code=422, detail=f"Error converting video: {stderr.decode()}")
 
-                file_size = os.stat(tmp_mp4_path).st_size
+                file_size = await self._io_executor.run(os.path.getsize, tmp_mp4_path)
                 return build_streaming_response(
                     request,
                     stream=open(tmp_mp4_path, "rb"),  # noqa: SIM115
@@ -114,13 +119,13 @@ class ResourcesHandler(IResourcesHandler):
         file_path: str = Path(..., description="The file's path within the dataset"),
         time: Optional[float] = Query(None, description="Time (in seconds) to extract the thumbnail from"),
     ) -> Response:
-        full_path = self._get_full_path(file_path, dataset, version)
+        full_path = await self._io_executor.run(self._get_full_path, file_path, dataset, version)
 
         if time is None:
             cache_path = self._indexes_path / dataset / version / "thumbnails" / (file_path + ".jpg")
         else:
             cache_path = self._indexes_path / dataset / version / "thumbnails" / (file_path + "." + str(time) + ".jpg")
-        if cache_path.exists():
+        if await self._io_executor.run(cache_path.exists):
             return FileResponse(cache_path, headers={"X-CACHED": "true"})
 
         mime_type, _ = mimetypes.guess_type(full_path)
@@ -172,11 +177,11 @@ class ResourcesHandler(IResourcesHandler):
         end: float = Query(..., description="Clip end time in seconds"),
     ) -> Response:
         content_type = "video/mp4"
-        full_path = self._get_full_path(file_path, dataset, version)
+        full_path = await self._io_executor.run(self._get_full_path, file_path, dataset, version)
 
         tmp_file_path = f"{Config.TMP_DIR}/{hash(('clip', full_path))}.mp4"
-        if os.path.exists(tmp_file_path):
-            file_size = os.stat(tmp_file_path).st_size
+        file_size = await self._io_executor.run(_get_file_size, tmp_file_path)
+        if file_size is not None:
             return build_streaming_response(
                 request,
                 stream=open(tmp_file_path, "rb"),  # noqa: SIM115
@@ -200,7 +205,7 @@ class ResourcesHandler(IResourcesHandler):
             if process.returncode != 0:
                 raise HTTPException(status_code=422, detail=f"Error processing video: {stderr.decode()}")
 
-            file_size = os.stat(tmp_file_path).st_size
+            file_size = await self._io_executor.run(os.path.getsize, tmp_file_path)
             return build_streaming_response(
                 request,
                 stream=open(tmp_file_path, "rb"),  # noqa: SIM115
@@ -221,6 +226,13 @@ class ResourcesHandler(IResourcesHandler):
         return full_path
 
 
+def _get_file_size(file_path: str) -> Optional[int]:
+    try:
+        return os.stat(file_path).st_size
+    except FileNotFoundError:
+        return None
+
+
 def _file_cleanup_task(file_path: str) -> BackgroundTask:
     """Cleanup function to close and delete the file after streaming"""
 
@@ -1,5 +1,4 @@
 import json
-import tempfile
 from abc import ABC, abstractmethod
 from typing import Annotated
 
@@ -8,11 +7,14 @@ from pydantic import BaseModel, Field, model_validator
 from pymilvus import MilvusException
 from pymilvus.exceptions import DescribeCollectionException
 
+from src.config import Config
 from src.entity.embedder.base import IEmbedder, Modality
 from src.entity.searcher.base import ISearcher
 from src.entity.storage.base import IStorage
 from src.types import CandidateWithCollection, Collection
 from src.utils.docstring import DocstringMixin
+from src.utils.executor import BoundedExecutor
+from src.utils.upload import UploadTooLargeError, spool_upload
 
 
 class SearchConfiguration(BaseModel):
@@ -89,14 +91,18 @@ class SearchHandler(ISearchHandler):
         embedder: IEmbedder,
         storage: IStorage,
         searcher: ISearcher,
+        inference_executor: BoundedExecutor,
+        io_executor: BoundedExecutor,
     ) -> None:
         self._embedder = embedder
         self._storage = storage
         self._searcher = searcher
+        self._inference_executor = inference_executor
+        self._io_executor = io_executor
 
     async def search_by_text(self, text: RequestText, config: SearchConfiguration) -> SearchResponse:
-        text_embedding = self._embedder.embed(text, modality=Modality.TEXT).detach().cpu().tolist()
-        return self._try_perform_search(text_embedding, config=config)
+        text_embedding = await self._inference_executor.run(self._embedder.embed, text, modality=Modality.TEXT)
+        return await self._try_perform_search(text_embedding.detach().cpu().tolist(), config=config)
 
     async def search_by_file(self, file: RequestFile, config: SearchConfiguration) -> SearchResponse:
         mime_type = file.content_type
@@ -112,25 +118,38 @@ class SearchHandler(ISearchHandler):
         else:
             raise HTTPException(status_code=422, detail="Received file without MIME type")
 
-        with tempfile.NamedTemporaryFile() as tmp_file:
-            saved_file_path = tmp_file.name
-            tmp_file.write(await file.read())
+        try:
+            spool = await self._io_executor.run(
+                spool_upload,
+                file.file,
+                max_size=Config.MAX_UPLOAD_SIZE_MB * 2**20,
+                max_memory_size=Config.UPLOAD_MEMORY_SIZE_MB * 2**20,
+                dir=Config.TMP_DIR,
+            )
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e)) from e
 
-            file_embedding = self._embedder.embed(saved_file_path, modality=file_modality).detach().cpu().tolist()
-            return self._try_perform_search(file_embedding, config=config)
+        with spool:
+            file_embedding = await self._inference_executor.run(
+                self._embedder.embed, spool.get_source(), modality=file_modality
+            )
+        return await self._try_perform_search(file_embedding.detach().cpu().tolist(), config=config)
 
     async def search_by_reference(
         self, id: RequestID, dataset: RequestDataset, version: RequestVersion, config: SearchConfiguration
     ) -> SearchResponse:
         try:
-            document = self._storage.get_by_id(id=id, dataset=dataset, version=version)
+            document = await self._io_executor.run(self._storage.get_by_id, id=id, dataset=dataset, version=version)
         except DescribeCollectionException as e:
             raise HTTPException(status_code=404, detail=e.message) from e
         except MilvusException as e:
             raise HTTPException(status_code=500, detail=f"Milvus error: {str(e)}") from e
-        return self._try_perform_search(document.embedding, config=config)
+        return await self._try_perform_search(document.embedding, config=config)
 
-    def _try_perform_search(self, embedding: list[float], config: SearchConfiguration) -> SearchResponse:
+    async def _try_perform_search(self, embedding: list[float], config: SearchConfiguration) -> SearchResponse:
+        return await self._io_executor.run(self._perform_search, embedding, config=config)
+
+    def _perform_search(self, embedding: list[float], config: SearchConfiguration) -> SearchResponse:
         try:
             candidates, session_id = self._searcher.search(
                 embedding=embedding,
@@ -148,6 +167,10 @@ class SearchHandler(ISearchHandler):
         )
 
     async def continue_search(self, request: ContinueSearchRequest) -> SearchResponse:
+        return await self._io_executor.run(self._continue_search, request)
+
+    def _continue_search(self, request: ContinueSearchRequest) -> SearchResponse:
+        # StopIteration can not be propagated through futures, so it is handled in the worker thread
         try:
             candidates = self._searcher.next(request.session_id)
         except StopIteration as e:
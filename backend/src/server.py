@@ -1,17 +1,21 @@
+import asyncio
 import logging
 import os
 import shutil
 from contextlib import asynccontextmanager
 
-from fastapi import APIRouter, FastAPI
+from fastapi import APIRouter, FastAPI, Request
 from fastapi.datastructures import Default
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import ORJSONResponse
 
 from src.config import Config
 from src.handler.info import IInfoHandler
+from src.handler.metrics import IMetricsHandler
 from src.handler.resources import IResourcesHandler
 from src.handler.search.v1 import ISearchHandler
+from src.utils.executor import BoundedExecutor, ExecutorOverloadedError
+from src.utils.upload import UploadSizeLimitMiddleware
 
 logger = logging.getLogger(__name__)
 
@@ -24,14 +28,20 @@ class AppServer:
         search_handler: ISearchHandler,
         info_handler: IInfoHandler,
         resources_handler: IResourcesHandler,
+        metrics_handler: IMetricsHandler,
+        executors: list[BoundedExecutor],
     ) -> None:
         self._search_handler = search_handler
         self._resources_handler = resources_handler
         self._info_handler = info_handler
+        self._metrics_handler = metrics_handler
+        self._executors = executors
 
     def create_application(self) -> FastAPI:
         logger.info("Creating application...")
-        app = FastAPI(title="ClipSeek Backend", lifespan=_lifespan)
+        app = FastAPI(title="ClipSeek Backend", lifespan=self._lifespan)
+        # added first to run inside CORS, so browsers can read its 413 responses
+        app.add_middleware(UploadSizeLimitMiddleware, max_size=Config.MAX_UPLOAD_SIZE_MB * 2**20)
         app.add_middleware(
             CORSMiddleware,  # noqa
             allow_origins=self._ORIGINS,
@@ -39,6 +49,7 @@ class AppServer:
             allow_methods=["*"],
             allow_headers=["*"],
         )
+        app.add_exception_handler(ExecutorOverloadedError, _executor_overloaded_handler)
         router = APIRouter(default_response_class=Default(ORJSONResponse))
         router.add_api_route(
             "/api/v1/search/by_text",
@@ -88,15 +99,27 @@ class AppServer:
             methods=["GET"],
             tags=["File-Proxy"],
         )
+        router.add_api_route(
+            "/metrics",
+            self._metrics_handler.get_metrics,
+            methods=["GET"],
+            tags=["Metrics"],
+        )
         app.include_router(router)
         logger.info("Starting app...")
         return app
 
+    @asynccontextmanager
+    async def _lifespan(self, app: FastAPI):  # noqa
+        if not os.path.exists(Config.TMP_DIR):
+            os.makedirs(Config.TMP_DIR)
+        yield
+        # drain in-flight calls before their temporary files are removed
+        for executor in self._executors:
+            await asyncio.to_thread(executor.shutdown, wait=True)
+        if os.path.exists(Config.TMP_DIR):
+            shutil.rmtree(Config.TMP_DIR)
+
 
-@asynccontextmanager
-async def _lifespan(app: FastAPI):  # noqa
-    if not os.path.exists(Config.TMP_DIR):
-        os.makedirs(Config.TMP_DIR)
-    yield
-    if os.path.exists(Config.TMP_DIR):
-        shutil.rmtree(Config.TMP_DIR)
+async def _executor_overloaded_handler(request: Request, exc: Exception) -> ORJSONResponse:  # noqa: ARG001
+    return ORJSONResponse(status_code=503, content={"detail": str(exc)})
@@ -0,0 +1,84 @@
+import asyncio
+import functools
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from src.utils.metrics import IMetricsProvider
+
+T = TypeVar("T")
+
+
+class ExecutorOverloadedError(RuntimeError):
+    pass
+
+
+class BoundedExecutor(IMetricsProvider):
+    """
+    Runs blocking calls in a dedicated thread pool without blocking the event loop.
+    Calls are rejected with `ExecutorOverloadedError` when more than `max_queue_size` calls are waiting for a worker.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue_size: int):
+        self._name = name
+        self._max_workers = max_workers
+        self._max_queue_size = max_queue_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active = 0
+        self._completed = 0
+        self._rejected = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:  # noqa: ANN401
+        with self._lock:
+            if self._pending >= self._max_queue_size:
+                self._rejected += 1
+                raise ExecutorOverloadedError(f"Executor '{self._name}' is overloaded, try again later.")
+            self._pending += 1
+
+        future = self._executor.submit(self._call, functools.partial(func, *args, **kwargs), time.monotonic())
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def get_metrics(self) -> dict[str, float]:
+        with self._lock:
+            started = self._completed + self._active
+            return {
+                "max_workers": self._max_workers,
+                "active": self._active,
+                "pending": self._pending,
+                "completed_total": self._completed,
+                "rejected_total": self._rejected,
+                "avg_queue_wait_ms": self._queue_wait_total / started * 1000 if started else 0.0,
+                "max_queue_wait_ms": self._queue_wait_max * 1000,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stops accepting calls. With `wait`, blocks until queued and running calls are finished."""
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _call(self, func: Callable[[], T], submitted_at: float) -> T:
+        queue_wait = time.monotonic() - submitted_at
+        with self._lock:
+            self._pending -= 1
+            self._active += 1
+            self._queue_wait_total += queue_wait
+            self._queue_wait_max = max(self._queue_wait_max, queue_wait)
+        try:
+            return func()
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+
+    def _on_done(self, future: Future) -> None:
+        if future.cancelled():
+            # cancelled before a worker picked it up
+            with self._lock:
+                self._pending -= 1
@@ -0,0 +1,7 @@
+from abc import ABC, abstractmethod
+
+
+class IMetricsProvider(ABC):
+    @abstractmethod
+    def get_metrics(self) -> dict[str, float]:
+        pass
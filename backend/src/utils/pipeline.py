@@ -0,0 +1,148 @@
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from src.utils.metrics import IMetricsProvider
+
+_DONE = object()
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    # returns the item for the next stage, or None to drop it
+    func: Callable[[Any], Any]
+    workers: int = 1
+
+
+@dataclass
+class _StageStats:
+    items: int = 0
+    busy_seconds: float = 0.0
+    queue_size_total: int = 0
+    running_workers: int = 0
+
+
+class Pipeline(IMetricsProvider):
+    """
+    Runs `stages` concurrently, each in its own threads, connected by queues of up to `queue_size` items, so the
+    pipeline is as fast as its slowest stage instead of the sum of them. Items from `source` are produced by the
+    `source_name` stage in the calling thread. Items of stages with several workers may be reordered.
+    The first exception of a stage stops the pipeline and is raised by `run`.
+    """
+
+    def __init__(self, stages: list[Stage], queue_size: int = 2, source_name: str = "source"):
+        self._stages = stages
+        self._source_name = source_name
+        self._queues: list[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self._lock = threading.Lock()
+        self._stats = {name: _StageStats() for name in (source_name, *(stage.name for stage in stages))}
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    def run(self, source: Iterable[Any]) -> None:
+        self._started_at = time.monotonic()
+        threads = []
+        for i, stage in enumerate(self._stages):
+            self._stats[stage.name].running_workers = stage.workers
+            for j in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(i,), name=f"{stage.name}-{j}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        try:
+            self._produce(iter(source))
+        except BaseException as e:
+            self._fail(e)
+        for thread in threads:
+            thread.join()
+        self._finished_at = time.monotonic()
+        if self._error is not None:
+            raise self._error
+
+    def get_metrics(self) -> dict[str, float]:
+        """Per stage: items, items per busy second, share of time workers were busy and mean input queue size."""
+        with self._lock:
+            wall_seconds = (self._finished_at or time.monotonic()) - (self._started_at or time.monotonic())
+            workers = {self._source_name: 1, **{stage.name: stage.workers for stage in self._stages}}
+            metrics: dict[str, float] = {}
+            for name, stats in self._stats.items():
+                metrics[f"{name}_items_total"] = stats.items
+                metrics[f"{name}_items_per_second"] = stats.items / stats.busy_seconds if stats.busy_seconds else 0.0
+                metrics[f"{name}_utilization"] = (
+                    stats.busy_seconds / (wall_seconds * workers[name]) if wall_seconds > 0 else 0.0
+                )
+            for stage in self._stages:
+                stats = self._stats[stage.name]
+                metrics[f"{stage.name}_avg_queue_size"] = stats.queue_size_total / stats.items if stats.items else 0.0
+        return metrics
+
+    def _produce(self, source: Iterator[Any]) -> None:
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            item = next(source, _DONE)
+            if item is _DONE:
+                break
+            self._record(self._source_name, time.perf_counter() - started)
+            self._put(0, item)
+        self._put(0, _DONE)
+
+    def _work(self, i: int) -> None:
+        stage = self._stages[i]
+        while True:
+            item = self._get(i)
+            if item is _DONE:
+                break
+            started = time.perf_counter()
+            try:
+                output = stage.func(item)
+            except BaseException as e:
+                self._fail(e)
+                break
+            self._record(stage.name, time.perf_counter() - started)
+            if output is not None and i + 1 < len(self._stages):
+                self._put(i + 1, output)
+
+        # other workers of the stage stop on the same marker, the last one passes it to the next stage
+        self._put(i, _DONE)
+        with self._lock:
+            self._stats[stage.name].running_workers -= 1
+            last = self._stats[stage.name].running_workers == 0
+        if last and i + 1 < len(self._stages):
+            self._put(i + 1, _DONE)
+
+    def _get(self, i: int) -> Any:  # noqa: ANN401
+        while not self._stop.is_set():
+            try:
+                item = self._queues[i].get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is not _DONE:
+                with self._lock:
+                    self._stats[self._stages[i].name].queue_size_total += self._queues[i].qsize() + 1
+            return item
+        return _DONE
+
+    def _put(self, i: int, item: Any) -> None:  # noqa: ANN401
+        while not self._stop.is_set():
+            try:
+                self._queues[i].put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._stats[name].items += 1
+            self._stats[name].busy_seconds += seconds
+
+    def _fail(self, error: BaseException) -> None:
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
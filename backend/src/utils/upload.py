@@ -0,0 +1,135 @@
+import hashlib
+import io
+import tempfile
+from typing import BinaryIO, Optional, Union
+
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class UploadTooLargeError(ValueError):
+    pass
+
+
+class HashedBuffer(io.BytesIO):
+    """In-memory file with the sha256 hex digest of its content, set once the content is written."""
+
+    sha256: str
+
+
+class HashedPath(str):
+    """File path with the sha256 hex digest of the file content."""
+
+    sha256: str
+
+    def __new__(cls, path: str, sha256: str) -> "HashedPath":
+        instance = super().__new__(cls, path)
+        instance.sha256 = sha256
+        return instance
+
+
+class UploadSpool:
+    """
+    Keeps an upload in memory up to `max_memory_size` bytes and rolls it over to a named temporary file in `dir`
+    above it, so small files are decoded straight from the buffer and large videos are read by path with seeking.
+    The content is hashed while written, so embedding caches need not read it again.
+    """
+
+    def __init__(self, max_memory_size: int, dir: Optional[str] = None):
+        self._max_memory_size = max_memory_size
+        self._dir = dir
+        self._buffer: Optional[HashedBuffer] = HashedBuffer()
+        self._file: Optional[tempfile._TemporaryFileWrapper] = None
+        self._hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        if self._buffer is not None and self.size + len(chunk) > self._max_memory_size:
+            self._file = tempfile.NamedTemporaryFile(dir=self._dir)
+            self._file.write(self._buffer.getbuffer())
+            self._buffer = None
+        (self._buffer or self._file).write(chunk)  # type: ignore[union-attr]
+        self._hasher.update(chunk)
+        self.size += len(chunk)
+
+    @property
+    def sha256(self) -> str:
+        return self._hasher.hexdigest()
+
+    def get_source(self) -> Union[BinaryIO, str]:
+        """Returns the in-memory buffer rewound to the start, or the temporary file path after a rollover."""
+        if self._buffer is not None:
+            self._buffer.sha256 = self.sha256
+            self._buffer.seek(0)
+            return self._buffer
+        self._file.flush()  # type: ignore[union-attr]
+        return HashedPath(self._file.name, sha256=self.sha256)  # type: ignore[union-attr]
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        self._buffer = None
+
+    def __enter__(self) -> "UploadSpool":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+
+def spool_upload(
+    stream: BinaryIO,
+    max_size: int,
+    max_memory_size: int,
+    dir: Optional[str] = None,
+    chunk_size: int = 2**20,
+) -> UploadSpool:
+    """Copies `stream` to an `UploadSpool` in chunks, raising `UploadTooLargeError` above `max_size` bytes."""
+    spool = UploadSpool(max_memory_size=max_memory_size, dir=dir)
+    try:
+        while chunk := stream.read(chunk_size):
+            if spool.size + len(chunk) > max_size:
+                raise UploadTooLargeError(f"File is larger than {max_size // 2**20} MB.")
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects requests with bodies larger than `max_size` bytes with 413 while they arrive, before form parsing spools
+    uploads to memory or disk: by Content-Length up front, and by a running count of received bytes otherwise.
+    """
+
+    def __init__(self, app: ASGIApp, max_size: int):
+        self._app = app
+        self._max_size = max_size
+        self._detail = f"Request is larger than {max_size // 2**20} MB."
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self._app(scope, receive, send)
+            return
+
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self._max_size:
+            response = ORJSONResponse(status_code=413, content={"detail": self._detail})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def receive_limited() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self._max_size:
+                    raise HTTPException(status_code=413, detail=self._detail)
+            return message
+
+        await self._app(scope, receive_limited, send)